@@ -2,6 +2,7 @@ from django.contrib import admin
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from api.cache import catalogue_cache
 from recipes.models import (Amount, Chosen, Ingredient, Recipe, ShoppingList,
                             Subscribe, Tag, User)
 
@@ -12,6 +13,10 @@ class IngredientResource(resources.ModelResource):
     class Meta:
         model = Ingredient
 
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        catalogue_cache.invalidate(Ingredient._meta.label)
+
 
 class IngredientAdmin(ImportExportModelAdmin):
     """Админ настройка ингридиентов."""
@@ -24,7 +29,8 @@ class IngredientAdmin(ImportExportModelAdmin):
 class UserAdmin(ImportExportModelAdmin):
     """Админ настройка пользователей."""
     list_display = ('id', 'role', 'first_name', 'last_name',
-                    'username', 'email', 'avatar',)
+                    'username', 'email', 'avatar',
+                    'recipes_count', 'subscribers_count',)
     list_editable = ('role', 'first_name', 'last_name',
                      'username', 'email', 'avatar',)
     search_fields = ('email', 'username',)
@@ -58,7 +64,7 @@ class RecipeAdmin(ImportExportModelAdmin):
     list_filter = ('tags',)
 
     def in_сhosen(self, obj):
-        return obj.favorited.all().count()
+        return obj.favorites_count
     in_сhosen.short_description = 'В избранном'
 
 
@@ -0,0 +1,360 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from api.querysets import recipes_queryset, viewer_subscriptions
+from recipes.models import Chosen, Recipe, ShoppingList, Tag
+
+CATALOGUE_CACHE_SIZE = 512
+
+# Параметры списка рецептов, из которых строится ключ кэша.
+RECIPE_CACHE_PARAMS = ('tags', 'author', 'limit', 'offset')
+# Параметры, не влияющие на ответ анонимному пользователю.
+RECIPE_CACHE_IGNORED = ('page', 'is_favorited', 'is_in_shopping_cart')
+
+
+class CatalogueCache:
+    """Кэш сериализованных списков справочников в памяти процесса.
+
+    У каждого справочника есть версия, которая увеличивается после
+    коммита любого изменения его модели. Запись сохраняется с версией,
+    прочитанной до запроса к базе, и выдаётся только пока версия не
+    изменилась, поэтому данные, посчитанные во время изменения
+    справочника, в кэш не попадут. Изменения из других воркеров версию
+    этого процесса не меняют, поэтому запись живёт не дольше
+    CATALOGUE_CACHE_TIMEOUT секунд.
+    """
+
+    def __init__(self, max_entries=CATALOGUE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.modified = {}
+
+    def version(self, label):
+        with self.lock:
+            return self.versions.get(label, 0)
+
+    def last_modified(self, label):
+        with self.lock:
+            return self.modified.setdefault(label, int(time.time()))
+
+    def invalidate(self, label):
+        """Сброс справочника после коммита текущей транзакции."""
+        transaction.on_commit(lambda: self.reset(label))
+
+    def reset(self, label):
+        with self.lock:
+            self.versions[label] = self.versions.get(label, 0) + 1
+            self.modified[label] = int(time.time())
+            for key in [key for key in self.entries if key[0] == label]:
+                del self.entries[key]
+
+    def get(self, label, key):
+        with self.lock:
+            entry = self.entries.get((label, key))
+            if (entry is None or entry[0] != self.versions.get(label, 0)
+                    or time.monotonic() > entry[3]):
+                return None
+            self.entries.move_to_end((label, key))
+            return entry
+
+    def set(self, label, key, version, body):
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        entry = (version, body, etag,
+                 time.monotonic() + settings.CATALOGUE_CACHE_TIMEOUT)
+        with self.lock:
+            if version == self.versions.get(label, 0):
+                previous = self.entries.get((label, key))
+                if previous is not None and previous[2] != etag:
+                    self.modified[label] = int(time.time())
+                self.entries[(label, key)] = entry
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+
+catalogue_cache = CatalogueCache()
+
+
+class TagSlugCache:
+    """Соответствие slug тега его id в памяти процесса.
+
+    Перечитывается при смене версии справочника тегов в catalogue_cache,
+    по истечении TAG_SLUG_CACHE_TIMEOUT (теги могли измениться в другом
+    воркере) и при запросе неизвестного slug.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.version = None
+        self.loaded = 0
+
+    def load(self, version):
+        ids = dict(Tag.objects.values_list('slug', 'id'))
+        with self.lock:
+            self.ids, self.version, self.loaded = ids, version, time.time()
+        return ids
+
+    def get(self, slugs=()):
+        version = catalogue_cache.version(Tag._meta.label)
+        with self.lock:
+            ids = self.ids
+            stale = (version != self.version or time.time() - self.loaded
+                     > settings.TAG_SLUG_CACHE_TIMEOUT)
+        if stale or not set(slugs) <= ids.keys():
+            ids = self.load(version)
+        return ids
+
+
+tag_cache = TagSlugCache()
+
+
+class CachedListMixin:
+    """Отдача списка справочника из кэша с заголовками ETag/Last-Modified.
+
+    Ключ кэша - значения параметров запроса из cache_params, повторный
+    запрос с If-None-Match или If-Modified-Since получает ответ 304.
+    """
+    cache_label = None
+    cache_params = ()
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        key = tuple(request.query_params.get(param)
+                    for param in self.cache_params)
+        entry = catalogue_cache.get(self.cache_label, key)
+        if entry is None:
+            version = catalogue_cache.version(self.cache_label)
+            response = super().list(request, *args, **kwargs)
+            body = request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context())
+            entry = catalogue_cache.set(self.cache_label, key, version, body)
+        _, body, etag, _ = entry
+        last_modified = catalogue_cache.last_modified(self.cache_label)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(body,
+                                    content_type=request.accepted_media_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class RecipeResponseCache:
+    """Кэш ответов API рецептов для анонимных пользователей.
+
+    Ключ записи состоит из параметров запроса и версий областей, от
+    которых зависит ответ: справочников, всех списков, рецептов автора
+    или одного рецепта. При изменении данных версии затронутых областей
+    заменяются случайными значениями, и старые записи больше не находятся.
+    Версии хранятся в том же бэкенде, что и ответы, поэтому с общим
+    бэкендом сброс сразу виден всем воркерам.
+    """
+
+    def __init__(self, alias='recipes'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def versions(self, scopes):
+        keys = [f'recipes:version:{scope}' for scope in scopes]
+        versions = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            for key in missing:
+                self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            versions.update(self.cache.get_many(missing))
+        return [versions.get(key) for key in keys]
+
+    def invalidate(self, *scopes):
+        """Сброс областей после коммита текущей транзакции."""
+        transaction.on_commit(lambda: self.cache.set_many(
+            {f'recipes:version:{scope}': uuid.uuid4().hex
+             for scope in scopes}, timeout=None))
+
+    def key(self, scopes, params):
+        versions = self.versions(scopes)
+        if None in versions:
+            return None
+        digest = hashlib.md5(repr((versions, params)).encode()).hexdigest()
+        return f'recipes:response:{digest}'
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, body):
+        self.cache.set(key, body)
+
+    def get_recipes(self, ids, host, build):
+        """Общая для всех пользователей часть вывода рецептов ids.
+
+        Каждый рецепт хранится отдельно под версией справочников и своей
+        версией. Отсутствующие в кэше рецепты строятся функцией build
+        одним вызовом. Возвращает {id: данные} для существующих рецептов.
+        """
+        versions = self.versions(
+            ['catalogue', *(f'recipe:{pk}' for pk in ids)])
+        keys = {pk: 'recipes:recipe:' + hashlib.md5(repr(
+            (host, pk, versions[0], version)).encode()).hexdigest()
+            for pk, version in zip(ids, versions[1:])}
+        cached = self.cache.get_many(keys.values())
+        recipes = {pk: cached[key] for pk, key in keys.items()
+                   if key in cached}
+        missing = [pk for pk in ids if pk not in recipes]
+        if missing:
+            built = build(missing)
+            self.cache.set_many({keys[pk]: data
+                                 for pk, data in built.items()
+                                 if None not in versions})
+            recipes.update(built)
+        return recipes
+
+
+recipe_cache = RecipeResponseCache()
+
+
+def recipe_list_params(query_params):
+    """Нормализованные параметры списка рецептов.
+
+    Возвращает None для запросов с другими параметрами или с
+    некорректными значениями: такие ответы не кэшируются.
+    """
+    if set(query_params) - {*RECIPE_CACHE_PARAMS, *RECIPE_CACHE_IGNORED}:
+        return None
+    try:
+        author, limit, offset = (
+            int(query_params[param]) if query_params.get(param) else None
+            for param in ('author', 'limit', 'offset'))
+    except ValueError:
+        return None
+    tags = tuple(sorted(set(query_params.getlist('tags'))))
+    return tags, author, limit, offset
+
+
+class AnonymousRecipeCacheMixin:
+    """Отдача списка и страниц рецептов анонимным пользователям из кэша.
+
+    Для анонимного пользователя флаги избранного и списка покупок всегда
+    False, поэтому ответ зависит только от параметров запроса.
+    """
+
+    def cached_response(self, request, scopes, params, view, *args,
+                        **kwargs):
+        key = None
+        if (request.user.is_anonymous and params is not None
+                and request.accepted_renderer.format == 'json'):
+            key = recipe_cache.key(scopes, (
+                request.get_host(), request.accepted_media_type, params))
+        if key is None:
+            return view(request, *args, **kwargs)
+        body = recipe_cache.get(key)
+        if body is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = request.accepted_renderer.render(
+                response.data, request.accepted_media_type,
+                self.get_renderer_context())
+            recipe_cache.set(key, body)
+        return HttpResponse(body, content_type=request.accepted_media_type)
+
+    def list(self, request, *args, **kwargs):
+        params = recipe_list_params(request.query_params)
+        author = params and params[1]
+        scope = f'author:{author}' if author else 'list'
+        return self.cached_response(request, ('catalogue', scope), params,
+                                    super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        params = None if request.query_params else pk
+        return self.cached_response(request, ('catalogue', f'recipe:{pk}'),
+                                    params, super().retrieve, *args,
+                                    **kwargs)
+
+
+class PersonalizedRecipeMixin:
+    """Вывод рецептов авторизованному пользователю из общего кэша.
+
+    Общая часть каждого рецепта берётся из recipe_cache, а флаги
+    is_favorited, is_in_shopping_cart и author.is_subscribed
+    подставляются из трёх запросов принадлежности к множеству по id
+    рецептов страницы.
+    """
+
+    def personalized(self, request):
+        return (request.user.is_authenticated
+                and request.accepted_renderer.format == 'json'
+                and 'fields' not in request.query_params)
+
+    def build_recipes(self, ids):
+        recipes = recipes_queryset(AnonymousUser()).filter(id__in=ids)
+        return {data['id']: data for data in
+                self.get_serializer(recipes, many=True).data}
+
+    def personalize(self, request, ids):
+        recipes = recipe_cache.get_recipes(ids, request.get_host(),
+                                           self.build_recipes)
+        user = request.user
+        favorited = set(Chosen.objects.filter(
+            user=user, recipe__in=recipes).order_by().values_list(
+                'recipe_id', flat=True))
+        in_shopping_cart = set(ShoppingList.objects.filter(
+            user=user, recipe__in=recipes).order_by().values_list(
+                'recipe_id', flat=True))
+        subscriptions = viewer_subscriptions(request)
+        results = []
+        for pk in ids:
+            if pk not in recipes:
+                continue
+            data = dict(recipes[pk])
+            data['is_favorited'] = pk in favorited
+            data['is_in_shopping_cart'] = pk in in_shopping_cart
+            data['author'] = dict(
+                data['author'],
+                is_subscribed=data['author']['id'] in subscriptions)
+            results.append(data)
+        return results
+
+    def list(self, request, *args, **kwargs):
+        if not self.personalized(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(Recipe.objects.only('id'))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            page = queryset
+        results = self.personalize(request, [recipe.id for recipe in page])
+        if self.paginator is None:
+            return Response(results)
+        return self.get_paginated_response(results)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.personalized(request):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        results = self.personalize(request, [pk])
+        if not results:
+            raise Http404
+        return Response(results[0])
@@ -0,0 +1,20 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def shopping_cart_font_check(app_configs, **kwargs):
+    """Шрифт с кириллицей для выгрузки списка покупок в PDF.
+
+    Без шрифта остальное API работает, а выгрузка в PDF отвечает 503.
+    """
+    if os.path.isfile(settings.SHOPPING_CART_FONT):
+        return []
+    return [Warning(
+        f'Не найден шрифт SHOPPING_CART_FONT: {settings.SHOPPING_CART_FONT}',
+        hint=('Установите шрифт с кириллицей (например, пакет '
+              'fonts-dejavu-core) или укажите путь к нему в переменной '
+              'окружения SHOPPING_CART_FONT.'),
+        id='api.W001')]
@@ -1,26 +1,81 @@
+from django.conf import settings
+from django.db.models import (Case, Count, F, FloatField, IntegerField, Value,
+                              When)
+from django.db.models.functions import Cast, Greatest
+from django.forms import MultipleChoiceField
 from django_filters.rest_framework import CharFilter, FilterSet
-from django_filters.rest_framework.filters import (ModelChoiceFilter,
-                                                   ModelMultipleChoiceFilter,
+from django_filters.rest_framework.filters import (BaseInFilter, ChoiceFilter,
+                                                   ModelChoiceFilter,
+                                                   MultipleChoiceFilter,
                                                    NumberFilter)
 
-from recipes.models import Ingredient, Recipe, Tag, User
+from api.cache import tag_cache
+from api.search import search_recipes
+from recipes.models import Amount, Ingredient, Recipe, User
+
+# Ленты рецептов по оценкам из RecipeScore.
+FEED_ORDERINGS = (
+    ('popular', 'Популярные'),
+    ('trending', 'Набирающие популярность'),
+)
+
+
+class TagSlugField(MultipleChoiceField):
+    """Slug тегов, проверяемые по кэшу тегов без запроса к базе."""
+
+    def valid_value(self, value):
+        return value in tag_cache.get([value])
+
+
+class TagSlugFilter(MultipleChoiceFilter):
+    field_class = TagSlugField
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    pass
 
 
 class RecipeFilter(FilterSet):
     """Фильтр для рецептов."""
     author = ModelChoiceFilter(queryset=User.objects.all())
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug')
-    ingredients__name = CharFilter(lookup_expr='icontains')
+    tags = TagSlugFilter(method='filter_tags')
+    ingredients__name = CharFilter(method='filter_ingredients_name')
+    search = CharFilter(method='filter_search')
     is_favorited = NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = NumberFilter(method='filter_is_in_shopping_cart')
+    have = NumberInFilter(method='filter_have')
+    missing = NumberFilter(method='filter_missing')
+    ordering = ChoiceFilter(choices=FEED_ORDERINGS, method='filter_ordering')
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author', 'ingredients']
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты с любым из тегов.
+
+        Подзапрос к таблице связей по индексу (tag_id, recipe_id) вместо
+        JOIN, поэтому рецепты с несколькими подходящими тегами не
+        дублируются.
+        """
+        tag_ids = tag_cache.get(value)
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag_id__in=[tag_ids[slug] for slug in value]).values('recipe_id'))
+
+    def filter_ingredients_name(self, queryset, name, value):
+        """Рецепты с ингредиентом, в названии которого есть value.
+
+        Подходящие ингредиенты ищутся по индексу на названии, рецепты с
+        ними - по индексу (ingredient, recipe) таблицы количеств.
+        """
+        return queryset.filter(id__in=Amount.objects.filter(
+            ingredient__in=Ingredient.objects.filter(name__icontains=value)
+        ).values('recipe_id'))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию с ранжированием."""
+        return search_recipes(queryset, value)
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if not user.is_authenticated:
@@ -41,11 +96,60 @@ class RecipeFilter(FilterSet):
             queryset = queryset.filter(favorited__user=user)
         return queryset
 
+    def filter_have(self, queryset, name, value):
+        """Рецепты из имеющихся ингредиентов по убыванию покрытия.
+
+        Кандидаты и число совпавших ингредиентов находятся одним GROUP BY
+        по строкам количеств с этими ингредиентами (индекс (ingredient,
+        recipe)). Покрытие - доля совпавших от ingredients_count рецепта.
+        """
+        matched = Count('recipe_ingredients')
+        return queryset.filter(
+            recipe_ingredients__ingredient__in=[int(id) for id in value]
+        ).annotate(
+            matched_ingredients=matched,
+            missing_ingredients=F('ingredients_count') - matched,
+            coverage=Cast(matched, FloatField()) / Greatest(
+                'ingredients_count', matched, output_field=FloatField()),
+        ).order_by('-coverage', 'missing_ingredients', '-id')
+
+    def filter_missing(self, queryset, name, value):
+        """Не больше value недостающих ингредиентов, вместе с ?have=."""
+        if not self.form.cleaned_data.get('have'):
+            return queryset
+        return queryset.filter(missing_ingredients__lte=value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Лента popular или trending по заранее посчитанной оценке.
+
+        Оценки хранятся в RecipeScore и обновляются при действиях
+        пользователей и командой recompute_recipe_scores, при чтении
+        рейтинг не считается.
+        """
+        return queryset.filter(score__isnull=False).annotate(
+            feed_score=F(f'score__{value}')).order_by('-feed_score', '-id')
+
 
 class IngredientFilter(FilterSet):
     """Фильтр для ингридиентов."""
-    name = CharFilter(lookup_expr='icontains')
+    name = CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        """Поиск по названию: сначала совпадения с начала слова.
+
+        На PostgreSQL поиск по подстроке идёт по триграммному GIN индексу
+        на UPPER(name). На остальных базах UPPER(name) LIKE не может
+        использовать обычный индекс на названии, и таблица просматривается
+        целиком, индекс нужен только для сортировки по названию.
+        Количество результатов ограничено, так как пагинация для
+        ингредиентов отключена.
+        """
+        return queryset.filter(name__icontains=value).annotate(
+            is_prefix=Case(When(name__istartswith=value, then=Value(0)),
+                           default=Value(1),
+                           output_field=IntegerField())
+        ).order_by('is_prefix', 'name')[:settings.INGREDIENT_SEARCH_LIMIT]
@@ -0,0 +1,88 @@
+import io
+import timeit
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONParser, FastJSONRenderer, orjson
+
+RECIPE_TEXT = ('Нарежьте овощи кубиками, обжарьте на сливочном масле до '
+               'золотистого цвета, добавьте специи и тушите под крышкой '
+               'двадцать минут. ') * 4
+
+
+def recipe_list_payload(recipes, ingredients):
+    """Страница списка рецептов в том виде, в каком её отдаёт API."""
+    results = [OrderedDict(
+        id=recipe_id,
+        tags=[OrderedDict(id=tag_id, name=f'Тег {tag_id}',
+                          slug=f'tag{tag_id}') for tag_id in (1, 2)],
+        author=OrderedDict(
+            email=f'povar{recipe_id}@example.ru', id=recipe_id,
+            username=f'povar{recipe_id}', first_name='Анна',
+            last_name='Иванова', is_subscribed=False, avatar=None),
+        ingredients=[OrderedDict(
+            id=ingredient_id, name=f'ингредиент номер {ingredient_id}',
+            measurement_unit='г', amount=100 + ingredient_id)
+            for ingredient_id in range(ingredients)],
+        is_favorited=True,
+        is_in_shopping_cart=False,
+        name=f'Рагу из овощей №{recipe_id}',
+        image=f'http://foodgram.example.ru/media/recipes/{recipe_id}.jpg',
+        text=RECIPE_TEXT,
+        cooking_time=45,
+    ) for recipe_id in range(recipes)]
+    return OrderedDict(count=recipes, next=None, previous=None,
+                       results=results)
+
+
+class Command(BaseCommand):
+    """Сравнение скорости JSON рендерера и парсера API со стандартными."""
+    help = ('Замеряет рендеринг и разбор типичной страницы списка рецептов '
+            'стандартными JSONRenderer/JSONParser и быстрыми из '
+            'api.renderers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100,
+            help='Количество рецептов на странице.')
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=8,
+            help='Количество ингредиентов в рецепте.')
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=200,
+            help='Количество повторов каждого замера.')
+
+    def measure(self, label, function, number):
+        seconds = min(timeit.repeat(function, number=number, repeat=3))
+        self.stdout.write(f'{label}: {seconds / number * 1000:.3f} мс')
+        return seconds
+
+    def handle(self, *args, **options):
+        data = recipe_list_payload(options['recipes'],
+                                   options['ingredients'])
+        number = options['number']
+        self.stdout.write('orjson: ' + ('да' if orjson else 'нет'))
+        results = {}
+        for name, renderer, parser in (
+                ('стандартный', JSONRenderer(), JSONParser()),
+                ('быстрый', FastJSONRenderer(), FastJSONParser())):
+            body = renderer.render(data, 'application/json')
+            self.stdout.write(f'{name}: {len(body)} байт')
+            results[name] = (
+                self.measure(f'{name} рендеринг',
+                             lambda: renderer.render(data), number),
+                self.measure(f'{name} разбор',
+                             lambda: parser.parse(io.BytesIO(body)), number))
+        for index, operation in enumerate(('рендеринг', 'разбор')):
+            speedup = results['стандартный'][index] / results['быстрый'][index]
+            self.stdout.write(self.style.SUCCESS(
+                f'{operation}: быстрее в {speedup:.1f} раз'))
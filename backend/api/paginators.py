@@ -1,9 +1,179 @@
-from rest_framework.pagination import LimitOffsetPagination
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       LimitOffsetPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def cached_count(queryset):
+    """Количество записей выборки, закэшированное на короткое время.
+
+    Заведомо пустая выборка (queryset.none()) не компилируется в SQL,
+    для неё сразу возвращается 0.
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = 'count:' + hashlib.md5(sql.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+    return count
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по -id.
+
+    Страница выбирается условием id < курсора, а не OFFSET, поэтому
+    глубокие страницы не дороже первой. Поле count приблизительное:
+    берётся из кэша и обновляется раз в PAGINATION_COUNT_TIMEOUT секунд.
+    Выборку, которую фильтр уже отсортировал иначе (ранжирование ?search=
+    и ?have=), курсор по id пролистал бы в другом порядке, поэтому такая
+    комбинация отклоняется.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = page_size
+    ordering = '-id'
+    ordering_conflict_message = (
+        'Курсорная пагинация недоступна для выдачи, упорядоченной по '
+        'релевантности. Используйте limit и offset.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if queryset.query.order_by not in ((), (self.ordering,)):
+            raise ValidationError(
+                {'pagination': [self.ordering_conflict_message]})
+        self.count = cached_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class ScoreKeysetPagination(BasePagination):
+    """Курсорная пагинация лент popular и trending по (feed_score, id).
+
+    Курсор хранит направление, оценку и id крайнего рецепта страницы.
+    Соседняя страница выбирается условием по индексу оценок без OFFSET:
+    следующая - по убыванию (feed_score, id) после последнего рецепта,
+    предыдущая - по возрастанию перед первым и затем разворачивается.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count = cached_count(queryset)
+        limit = self.get_page_size(request)
+        reverse, score, pk = self.decode_cursor(request)
+        if reverse:
+            queryset = queryset.filter(
+                Q(feed_score__gt=score) | Q(feed_score=score, id__gt=pk)
+            ).order_by('feed_score', 'id')
+        elif pk is not None:
+            queryset = queryset.filter(
+                Q(feed_score__lt=score) | Q(feed_score=score, id__lt=pk))
+        page = list(queryset[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        if reverse:
+            page.reverse()
+        self.next = self.previous = None
+        if page and (has_more or reverse):
+            self.next = (False, page[-1].feed_score, page[-1].id)
+        if page and (has_more if reverse else pk is not None):
+            self.previous = (True, page[0].feed_score, page[0].id)
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None, None
+        try:
+            direction, score, pk = urlsafe_b64decode(
+                encoded.encode('ascii')).decode('ascii').split(':')
+            if direction not in ('n', 'p'):
+                raise ValueError
+            return direction == 'p', float(score), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        reverse, score, pk = cursor
+        direction = 'p' if reverse else 'n'
+        return urlsafe_b64encode(
+            f'{direction}:{score!r}:{pk}'.encode('ascii')).decode('ascii')
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), 'pagination')
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(cursor))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_link(self.next)),
+            ('previous', self.get_link(self.previous)),
+            ('results', data)
+        ]))
 
 
 class StandardResultsSetPagination(LimitOffsetPagination):
-    """Пагинатор для моделей модуля."""
+    """Пагинатор для моделей модуля.
+
+    По умолчанию limit/offset, с параметром ?pagination=cursor (или уже
+    полученным ?cursor=) - курсорная пагинация KeysetPagination. Ленты
+    ?ordering=popular и ?ordering=trending всегда листаются курсором
+    ScoreKeysetPagination.
+    """
 
     page_size = 6
     default_limit = page_size
     max_limit = page_size
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if 'feed_score' in queryset.query.annotations:
+            self.keyset = ScoreKeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        if (request.query_params.get('pagination') == 'cursor'
+                or KeysetPagination.cursor_query_param
+                in request.query_params):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,22 +1,344 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import csv
+import io
+import os
+from collections import defaultdict
 
-from recipes.models import Amount
+from django.conf import settings
+from django.db import connection
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_delete, post_save
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.exceptions import APIException
+from rest_framework.status import HTTP_503_SERVICE_UNAVAILABLE
 
+from recipes.counters import COUNTERS, actual_count, recount_cart_totals
+from recipes.models import (Amount, Chosen, Recipe, ShoppingCartTotal,
+                            ShoppingList, Subscribe)
+from recipes.scores import SCORE_EVENTS, bump_scores
+from recipes.signals import defer_recount
 
-def shopping_cart_file(self, request, user):
-    """Функция формирования файлов ингридиентов."""
-    ingridients = Amount.objects.filter(
-        recipe__in_shopping_cart__user=user).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-                sum_amount=Sum(
-                    'amount', distinct=True)).order_by('ingredient__name')
-    shopping_txt = 'Список покупок. Пользователь - '
-    shopping_txt += (f"{user.first_name} {user.last_name}\n")
+PDF_MARGIN = 40
+
+# Поля вывода рецепта и столбцы таблицы рецептов, нужные для них.
+RECIPE_FIELD_COLUMNS = {
+    'author': ('author',),
+    'name': ('name',),
+    'image': ('image',),
+    'images': ('image', 'image_renditions'),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+}
+RECIPE_FIELDS = (*RECIPE_FIELD_COLUMNS, 'tags', 'ingredients',
+                 'is_favorited', 'is_in_shopping_cart')
+
+
+def recipes_queryset(user, fields=None):
+    """Рецепты со всеми связями и флагами текущего пользователя.
+
+    Автор подгружается через JOIN, теги и ингредиенты - отдельными
+    prefetch-запросами, а флаги избранного и списка покупок считаются
+    подзапросами EXISTS. Число запросов не зависит от количества
+    рецептов на странице.
+
+    Если передан набор выводимых полей fields, читаются только нужные
+    столбцы, а JOIN, prefetch и подзапросы для остальных полей
+    пропускаются.
+    """
+    queryset = Recipe.objects.all()
+    if fields is not None:
+        queryset = queryset.only('id', *(
+            column for field in fields
+            for column in RECIPE_FIELD_COLUMNS.get(field, ())))
+    else:
+        fields = RECIPE_FIELDS
+    if 'author' in fields:
+        queryset = queryset.select_related('author')
+    if 'tags' in fields:
+        queryset = queryset.prefetch_related('tags')
+    if 'ingredients' in fields:
+        queryset = queryset.prefetch_related(Prefetch(
+            'recipe_ingredients',
+            queryset=Amount.objects.select_related('ingredient')))
+    for flag, model in (('is_favorited', Chosen),
+                        ('is_in_shopping_cart', ShoppingList)):
+        if flag not in fields:
+            continue
+        if user.is_anonymous:
+            value = Value(False, output_field=BooleanField())
+        else:
+            value = Exists(model.objects.filter(user=user,
+                                                recipe=OuterRef('pk')))
+        queryset = queryset.annotate(**{flag: value})
+    return queryset
+
+
+def viewer_subscriptions(request):
+    """Множество id авторов, на которых подписан текущий пользователь.
+
+    Загружается одним запросом при первом обращении и хранится на объекте
+    запроса, поэтому флаг is_subscribed для любого числа пользователей
+    в ответе проверяется без дополнительных запросов.
+    """
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    if not hasattr(request, 'viewer_subscriptions'):
+        request.viewer_subscriptions = set(
+            Subscribe.objects.filter(user=request.user).order_by()
+            .values_list('author_recipies_id', flat=True))
+    return request.viewer_subscriptions
+
+
+def prefetch_recipes_preview(authors, recipes_limit=None):
+    """Подгрузка последних рецептов для всех авторов страницы.
+
+    Первые recipes_limit рецептов каждого автора выбираются одним запросом
+    через ROW_NUMBER() OVER (PARTITION BY author), результат раскладывается
+    по авторам в атрибут recipes_preview.
+    """
+    queryset = Recipe.objects.filter(author__in=authors)
+    if recipes_limit is not None:
+        ranked = queryset.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=F('id').desc())).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        queryset = Recipe.objects.filter(id__in=RawSQL(
+            f'SELECT "id" FROM ({sql}) AS ranked WHERE "row_number" <= %s',
+            (*params, recipes_limit)))
+    previews = defaultdict(list)
+    for recipe in queryset.only('id', 'name', 'image', 'image_renditions',
+                                'cooking_time', 'author'):
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.id]
+
+
+def insert_ignore(instance):
+    """Добавление записи одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка добавлена, и False, если такая запись
+    уже есть. Для добавленной строки отправляется post_save, как при
+    обычном save(), чтобы обновились счётчики.
+    """
+    model = type(instance)
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING',
+            [field.get_db_prep_save(getattr(instance, field.attname),
+                                    connection)
+             for field in fields])
+        inserted = cursor.rowcount == 1
+    if inserted:
+        post_save.send(sender=model, instance=instance, created=True,
+                       update_fields=None, raw=False, using=connection.alias)
+    return inserted
+
+
+def delete_unique(instance):
+    """Удаление записи таблицы связей одним DELETE.
+
+    Запись ищется по всем полям instance, кроме первичного ключа, которые
+    для таблиц связей образуют уникальный ключ. Возвращает True, если
+    запись была удалена, и отправляет для неё post_delete.
+    """
+    model = type(instance)
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    quote_name = connection.ops.quote_name
+    conditions = ' AND '.join(f'{quote_name(field.column)} = %s'
+                              for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {conditions}',
+            [field.get_db_prep_value(getattr(instance, field.attname),
+                                     connection)
+             for field in fields])
+        deleted = cursor.rowcount > 0
+    if deleted:
+        post_delete.send(sender=model, instance=instance,
+                         using=connection.alias)
+    return deleted
+
+
+def recipe_amounts(recipe):
+    """Кол-во каждого ингредиента рецепта по id ингредиента."""
+    return dict(Amount.objects.filter(recipe=recipe).values_list(
+        'ingredient_id', 'amount'))
+
+
+def insert_ignore_many(instances, returning):
+    """Добавление записей одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает значения поля returning только у добавленных строк:
+    строки, уже добавленные параллельным запросом, RETURNING не выдаёт.
+    Сигналы post_save не отправляются.
+    """
+    model = type(instances[0])
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    row = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    rows = ', '.join([row] * len(instances))
+    column = quote_name(model._meta.get_field(returning).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES {rows} ON CONFLICT DO NOTHING RETURNING {column}',
+            [field.get_db_prep_save(getattr(instance, field.attname),
+                                    connection)
+             for instance in instances for field in fields])
+        return [value for value, in cursor.fetchall()]
+
+
+def bulk_relations(model, user, field, ids, add):
+    """Пакетное добавление или удаление связей пользователя с объектами.
+
+    Связи добавляются одним insert_ignore_many, который сигналы не шлёт,
+    поэтому счётчики затронутых объектов пересчитываются одним UPDATE,
+    оценки рецептов увеличиваются одним bump_scores, а пересчёт итогов
+    списка покупок откладывается до коммита, как в сигналах. Удаляемые
+    связи блокируются и удаляются обычным delete(), счётчики, оценки и
+    итоги после него пересчитываются сигналами один раз на транзакцию. Должна
+    вызываться внутри транзакции. Возвращает список id объектов, связь с
+    которыми изменилась.
+    """
+    attname = model._meta.get_field(field).attname
+    if not ids:
+        return []
+    if not add:
+        relations = model.objects.filter(user=user, **{f'{attname}__in': ids})
+        changed = list(relations.select_for_update().values_list(
+            attname, flat=True))
+        if changed:
+            relations.delete()
+        return changed
+    changed = insert_ignore_many(
+        [model(user=user, **{attname: pk}) for pk in ids], field)
+    if changed:
+        for counter_model, counter, counted_model, foreign_key in COUNTERS:
+            if counted_model is model:
+                counter_model.objects.filter(pk__in=changed).update(
+                    **{counter: actual_count(model, foreign_key)})
+        if model in SCORE_EVENTS:
+            bump_scores(changed, SCORE_EVENTS[model])
+        if model is ShoppingList:
+            defer_recount(recount_cart_totals, user.id)
+    return changed
+
+
+def shopping_cart_ingredients(user):
+    """Суммарное количество каждого ингредиента из списка покупок."""
+    return ShoppingCartTotal.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        sum_amount=F('total')).order_by(
+            'ingredient__name', 'ingredient__measurement_unit')
+
+
+def shopping_cart_title(user):
+    return f'Список покупок. Пользователь - {user.first_name} {user.last_name}'
+
+
+def shopping_cart_txt(user, ingridients):
+    """Построчная выгрузка списка покупок в текст."""
+    yield f'{shopping_cart_title(user)}\n'
+    for ingridient in ingridients:
+        yield (f"({ingridient['ingredient__name']} "
+               f"({ingridient['ingredient__measurement_unit']}) — "
+               f"{ingridient['sum_amount']})\n")
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_csv(user, ingridients):
+    """Построчная выгрузка списка покупок в CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingridient in ingridients:
+        yield writer.writerow((ingridient['ingredient__name'],
+                               ingridient['ingredient__measurement_unit'],
+                               ingridient['sum_amount']))
+
+
+class ShoppingCartFontMissing(APIException):
+    status_code = HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ('Выгрузка в PDF недоступна: на сервере не установлен '
+                      'шрифт с кириллицей. Выберите формат txt или csv.')
+    default_code = 'shopping_cart_font_missing'
+
+
+def shopping_cart_pdf(user, ingridients):
+    """Выгрузка списка покупок в PDF.
+
+    Таблица перекрёстных ссылок PDF пишется в конце файла, поэтому документ
+    собирается целиком и отдаётся одним куском. Шрифт SHOPPING_CART_FONT
+    обязателен: встроенные шрифты PDF не содержат кириллицы. Его наличие
+    проверяет shopping_cart_file до начала ответа.
+    """
+    font = 'ShoppingCartFont'
+    pdfmetrics.registerFont(TTFont(font, settings.SHOPPING_CART_FONT))
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    line_height = 16
+    y = height - PDF_MARGIN
+    page.setFont(font, 14)
+    page.drawString(PDF_MARGIN, y, shopping_cart_title(user))
+    y -= line_height * 2
+    page.setFont(font, 12)
     for ingridient in ingridients:
-        shopping_txt += (f"({ingridient['ingredient__name']} "
-                         f"({ingridient['ingredient__measurement_unit']}) — "
-                         f"{str(ingridient['sum_amount'])})\n")
-    return HttpResponse(shopping_txt,
-                        content_type='text/plain',
-                        charset="utf-8")
+        if y < PDF_MARGIN:
+            page.showPage()
+            page.setFont(font, 12)
+            y = height - PDF_MARGIN
+        page.drawString(PDF_MARGIN, y,
+                        f"{ingridient['ingredient__name']} "
+                        f"({ingridient['ingredient__measurement_unit']}) — "
+                        f"{ingridient['sum_amount']}")
+        y -= line_height
+    page.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_WRITERS = {
+    'txt': shopping_cart_txt,
+    'csv': shopping_cart_csv,
+    'pdf': shopping_cart_pdf,
+}
+
+
+def shopping_cart_file(self, request, user):
+    """Потоковая выгрузка списка покупок в формате из ?format=."""
+    renderer = request.accepted_renderer
+    if (renderer.format == 'pdf'
+            and not os.path.isfile(settings.SHOPPING_CART_FONT)):
+        raise ShoppingCartFontMissing()
+    ingridients = shopping_cart_ingredients(user).iterator()
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type += f'; charset={renderer.charset}'
+    response = StreamingHttpResponse(
+        SHOPPING_CART_WRITERS[renderer.format](user, ingridients),
+        content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{renderer.format}"')
+    return response
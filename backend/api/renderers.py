@@ -0,0 +1,87 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер выгрузки списка покупок.
+
+    Сам файл отдаётся потоковым ответом, рендерер нужен для выбора формата
+    через ?format= и для вывода сообщений об ошибках.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode('utf-8')
+
+
+class PlainTextRenderer(ShoppingCartRenderer):
+    """Выгрузка в текстовом формате."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingCartRenderer):
+    """Выгрузка в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ShoppingCartRenderer):
+    """Выгрузка в формате PDF."""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Компактный JSON в UTF-8 без экранирования кириллицы.
+
+    Если установлен orjson, данные сериализуются им, иначе стандартным
+    json без отступов. Типы, которых сериализатор не знает (Decimal,
+    ленивые строки), приводятся через JSONEncoder из DRF. Вывод с
+    отступами для ?indent= и Browsable API делает обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        default = self.encoder_class().default
+        if orjson is not None:
+            return orjson.dumps(data, default=default,
+                                option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(data, default=default, ensure_ascii=False,
+                          allow_nan=not self.strict,
+                          separators=(',', ':')).encode()
+
+
+class FastJSONParser(JSONParser):
+    """Разбор JSON тела запроса через orjson, если он установлен.
+
+    Без orjson и для кодировок, отличных от UTF-8, работает обычный
+    JSONParser.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,79 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+from recipes.search import SEARCH_TABLE
+
+# Окончания, которые отбрасываются при поиске на SQLite, от длинных
+# к коротким. Грубая замена русского стеммера snowball.
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ией', 'ием', 'иях', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ой', 'ей', 'ий',
+    'ый', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ью', 'ия', 'ию',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+WORD = re.compile(r'\w+')
+
+# Вес совпадения в названии и в описании, как веса A и B в PostgreSQL.
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def terms(text):
+    return {stem(word) for word in WORD.findall(text or '')}
+
+
+def match_expression(query):
+    """Запрос FTS5: все основы слов запроса как префиксы, через AND."""
+    return ' '.join(f'"{term}"*' for term in sorted(terms(query)))
+
+
+def search_recipes(queryset, query):
+    """Рецепты queryset, подходящие под поисковый запрос, по релевантности.
+
+    На PostgreSQL поиск идёт по столбцу search_vector с GIN индексом и
+    русским стеммингом, на SQLite - по индексу FTS5 из recipes.search,
+    где основы слов запроса ищутся как префиксы, а релевантность
+    считает bm25. Таблица индекса присоединяется через extra(), так как
+    вспомогательные функции FTS5 доступны только в запросе с MATCH к
+    ней самой, а коррелированный подзапрос на каждый рецепт повторял бы
+    поиск целиком. Рецепты упорядочиваются по убыванию релевантности, при
+    равной - по -id.
+    """
+    quote_name = connection.ops.quote_name
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                    SearchVectorField)
+        vector = RawSQL(
+            f'{quote_name(Recipe._meta.db_table)}.'
+            f'{quote_name("search_vector")}', [],
+            output_field=SearchVectorField())
+        search_query = SearchQuery(query, config='russian',
+                                   search_type='websearch')
+        return queryset.alias(search_vector=vector).filter(
+            search_vector=search_query).annotate(
+                rank=SearchRank(vector, search_query)).order_by('-rank', '-id')
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    recipe_id = (f'{quote_name(Recipe._meta.db_table)}.'
+                 f'{quote_name("id")}')
+    return queryset.extra(
+        tables=[SEARCH_TABLE],
+        where=[f'{SEARCH_TABLE}.rowid = {recipe_id}',
+               f'{SEARCH_TABLE} MATCH %s'],
+        params=[match],
+        select={'rank': f'bm25({SEARCH_TABLE}, %s, %s)'},
+        select_params=[NAME_WEIGHT, TEXT_WEIGHT],
+    ).order_by('rank', '-id')
@@ -1,27 +1,111 @@
 import base64
+import binascii
 
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import Case, F, PositiveSmallIntegerField, Value, When
 from rest_framework import serializers
-from rest_framework.serializers import (ImageField, IntegerField,
-                                        ModelSerializer,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
+from rest_framework.serializers import (ImageField, IntegerField, ListField,
+                                        ModelSerializer, ReadOnlyField,
                                         SerializerMethodField, ValidationError)
-from rest_framework.status import HTTP_400_BAD_REQUEST
 
+from api.querysets import recipe_amounts, viewer_subscriptions
+from recipes.counters import recount_recipe_cart_totals
+from recipes.images import reset_renditions, schedule_renditions
 from recipes.models import Amount, Ingredient, Recipe, Tag, User
+from recipes.signals import defer_recount
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл декодированного рисунка.
+
+    Хранилище перемещает файл при сохранении, поэтому он закрывается
+    при удалении объекта, как это делает Django для request.FILES.
+    """
+
+    def __del__(self):
+        self.close()
 
 
 class Base64ImageField(ImageField):
-    """Поверка рисунков по Base64."""
+    """Поверка рисунков по Base64.
+
+    Строка декодируется частями во временный файл на диске, поэтому
+    проверка Pillow и сохранение в хранилище работают с файлом, а не
+    с ещё одной копией рисунка в памяти.
+    """
+    chunk_size = 64 * 1024  # кратно 4, чтобы части декодировались отдельно
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]  # формат рисунка изымается
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext, format[len('data:'):])
         return super().to_internal_value(data)
 
+    def decode(self, imgstr, name, content_type):
+        file = DecodedImageFile(name, content_type, 0, None)
+        try:
+            for start in range(0, len(imgstr), self.chunk_size):
+                chunk = base64.b64decode(
+                    imgstr[start:start + self.chunk_size], validate=True)
+                file.size += len(chunk)
+                if file.size > settings.MAX_IMAGE_SIZE:
+                    raise ValidationError('Слишком большой рисунок.')
+                file.write(chunk)
+        except binascii.Error:
+            file.close()
+            raise ValidationError('Неверная строка Base64.')
+        except ValidationError:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+
+class ImageRenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии фото рецепта.
+
+    Пока копии не готовы, для всех размеров отдаётся исходное фото.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return {}
+        request = self.context.get('request')
+        storage = recipe.image.storage
+        urls = {}
+        for name in settings.IMAGE_RENDITIONS:
+            path = recipe.image_renditions.get(name)
+            url = storage.url(path) if path else recipe.image.url
+            urls[name] = (request.build_absolute_uri(url) if request
+                          else url)
+        return urls
+
+
+def requested_fields(request):
+    """Набор полей из параметра ?fields=id,name или None."""
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',') if field.strip()}
+
+
+class SparseFieldsMixin:
+    """Вывод только полей, переданных в аргументе fields."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
 class AvatarSerializer(ModelSerializer):
     """Сериализатор аватаров."""
@@ -32,7 +116,7 @@ class AvatarSerializer(ModelSerializer):
         fields = ('avatar',)
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ModelSerializer):
     """Сериализатор пользователя при выводе о не информации."""
     is_subscribed = SerializerMethodField()
     avatar = Base64ImageField()
@@ -44,13 +128,7 @@ class UserSerializer(ModelSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request:
-            return False
-        user = request.user
-        if user.is_anonymous:
-            return False
-        return user.user_subscribe.filter(author_recipies=obj).exists()
+        return obj.id in viewer_subscriptions(self.context.get('request'))
 
 
 class UserCreateSerializer(ModelSerializer):
@@ -113,13 +191,14 @@ class AmountSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(SparseFieldsMixin, ModelSerializer):
     """Сериализатор для вывода информации о рецепте."""
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer()
     image = Base64ImageField()
+    images = ImageRenditionsField()
     ingredients = AmountSerializer(source='recipe_ingredients',
                                    many=True, read_only=True)
 
@@ -127,24 +206,28 @@ class RecipeSerializer(ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'images', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return user.favorited.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return user.in_shopping_cart.filter(recipe=obj).exists()
 
 
 class AmountCreateRecipeSerializer(ModelSerializer):
     """Вспомогательный сериализатор для CreateRecipeSerializer."""
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = IntegerField()
     amount = IntegerField(min_value=settings.MIN_AMOUNT,
                           max_value=settings.MAX_AMOUNT)
 
@@ -156,8 +239,9 @@ class AmountCreateRecipeSerializer(ModelSerializer):
 class CreateRecipeSerializer(ModelSerializer):
     """Сериализатор рецептов для их создания."""
     ingredients = AmountCreateRecipeSerializer(many=True, write_only=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+    tags = ListField(child=IntegerField(), write_only=True)
     image = Base64ImageField()
+    images = ImageRenditionsField()
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
@@ -167,7 +251,7 @@ class CreateRecipeSerializer(ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
-                  'image', 'name', 'text', 'cooking_time',
+                  'image', 'images', 'name', 'text', 'cooking_time',
                   'is_favorited', 'is_in_shopping_cart')
 
     def get_is_favorited(self, obj):
@@ -177,31 +261,44 @@ class CreateRecipeSerializer(ModelSerializer):
         return obj.in_shopping_cart.exists()
 
     def validate_ingredients(self, value):
+        """Проверка ингредиентов одним запросом in_bulk.
+
+        id ингредиентов заменяются на найденные объекты.
+        """
         ingredients = value
         if not ingredients:
             raise ValidationError(
                 {'ingredients': 'Ингредиент, обязательное поле!'})
-        ingredients_set = set()
+        ids = [item['id'] for item in ingredients]
+        if len(set(ids)) != len(ids):
+            raise ValidationError(
+                {'ingredients': 'Дублирование ингредиентов запрещено!'})
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [id for id in ids if id not in found]
+        if missing:
+            raise ValidationError(
+                {'ingredients': f'Ингредиенты не найдены: {missing}'})
         for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_set:
-                raise ValidationError(
-                    {'ingredients': 'Дублирование ингредиентов запрещено!'})
-            ingredients_set.add(ingredient)
+            item['id'] = found[item['id']]
         return value
 
     def validate_tags(self, value):
+        """Проверка тегов одним запросом in_bulk.
+
+        id тегов заменяются на найденные объекты.
+        """
         tags = value
         if not tags:
             raise ValidationError(
                 {'tags': 'Тег, обязательное поле!'})
-        tags_set = set()
-        for tag in tags:
-            if tag in tags_set:
-                raise ValidationError(
-                    {'tags': 'Дублирование тегов запрещено!'})
-            tags_set.add(tag)
-        return value
+        if len(set(tags)) != len(tags):
+            raise ValidationError(
+                {'tags': 'Дублирование тегов запрещено!'})
+        found = Tag.objects.in_bulk(tags)
+        missing = [id for id in tags if id not in found]
+        if missing:
+            raise ValidationError({'tags': f'Теги не найдены: {missing}'})
+        return [found[id] for id in tags]
 
     def add_ingredients_or_tags(self, recipe, ingredients_data, tags_data):
         recipe.tags.set(tags_data)
@@ -218,10 +315,13 @@ class CreateRecipeSerializer(ModelSerializer):
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data, ingredients_count=len(ingredients_data))
         self.add_ingredients_or_tags(recipe, ingredients_data, tags_data)
+        schedule_renditions(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         if not ingredients_data:
@@ -231,27 +331,78 @@ class CreateRecipeSerializer(ModelSerializer):
         if not tags_data:
             raise ValidationError(
                 {'tags': 'Тег, обязательное поле!'})
-        instance.image = validated_data.get('image', instance.image)
+        update_fields = ['name', 'text', 'cooking_time', 'ingredients_count']
+        if 'image' in validated_data:
+            reset_renditions(instance)
+            instance.image = validated_data['image']
+            schedule_renditions(instance.id)
+            update_fields += ['image', 'image_renditions']
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self.add_ingredients_or_tags(instance, ingredients_data, tags_data)
-        instance.save()
+        instance.tags.set(tags_data)
+        old_amounts = recipe_amounts(instance)
+        new_amounts = {item['id'].id: item['amount']
+                       for item in ingredients_data}
+        if new_amounts != old_amounts:
+            self.update_ingredients(instance, old_amounts, new_amounts)
+            for ingredient_id in old_amounts.keys() | new_amounts.keys():
+                if old_amounts.get(ingredient_id) != new_amounts.get(
+                        ingredient_id):
+                    defer_recount(recount_recipe_cart_totals,
+                                  (instance.id, ingredient_id))
+        instance.ingredients_count = len(new_amounts)
+        instance.save(update_fields=update_fields)
         return instance
 
+    def update_ingredients(self, recipe, old_amounts, new_amounts):
+        """Изменение только отличающихся строк кол-ва ингредиентов.
+
+        Удалённые ингредиенты убираются одним DELETE, новые добавляются
+        одним bulk_create, изменённые кол-ва меняются одним UPDATE с CASE.
+        """
+        recipe_ingredients = Amount.objects.filter(recipe=recipe)
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            recipe_ingredients.filter(ingredient__in=removed).delete()
+        added = new_amounts.keys() - old_amounts.keys()
+        if added:
+            Amount.objects.bulk_create(
+                Amount(recipe=recipe, ingredient_id=ingredient_id,
+                       amount=new_amounts[ingredient_id])
+                for ingredient_id in added)
+        changed = {ingredient_id: amount
+                   for ingredient_id, amount in new_amounts.items()
+                   if old_amounts.get(ingredient_id, amount) != amount}
+        if changed:
+            recipe_ingredients.filter(ingredient__in=changed).update(
+                amount=Case(*(When(ingredient=ingredient_id,
+                                   then=Value(amount))
+                              for ingredient_id, amount in changed.items()),
+                            default=F('amount'),
+                            output_field=PositiveSmallIntegerField()))
+
     def to_representation(self, instance):
         """Корректировка формата вывода данных."""
         ret = super().to_representation(instance)
         ret['ingredients'] = AmountSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredient'),
+            many=True).data
         ret['tags'] = TagSerializer(instance.tags.all(), many=True).data
         ret['author'] = UserSerializer(instance.author).data
         return ret
 
 
+class BatchSerializer(serializers.Serializer):
+    """Список id объектов для пакетных запросов."""
+    ids = ListField(child=IntegerField(min_value=1), allow_empty=False,
+                    max_length=settings.BATCH_SIZE_LIMIT)
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
 class FavoriteRecipeSerializer(ModelSerializer):
     """Сериализатор избранных рецептов."""
     image = Base64ImageField(read_only=True)
@@ -261,15 +412,6 @@ class FavoriteRecipeSerializer(ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = ('name', 'cooking_time')
 
-    def validate(self, data):
-        recipe = self.context['recipe']
-        user = self.context['request'].user
-        if user.favorited.filter(recipe=recipe).exists():
-            raise ValidationError(
-                detail='Рецепт уже в избранном.',
-                code=HTTP_400_BAD_REQUEST)
-        return recipe
-
 
 class ShoppingListSerializer(ModelSerializer):
     """Сериализатор рецептов для списка покупок."""
@@ -280,23 +422,15 @@ class ShoppingListSerializer(ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = ('name', 'cooking_time')
 
-    def validate(self, data):
-        recipe = self.context['recipe']
-        user = self.context['request'].user
-        if user.in_shopping_cart.filter(recipe=recipe).exists():
-            raise ValidationError(
-                detail='Рецепт уже в списке покупок.',
-                code=HTTP_400_BAD_REQUEST)
-        return recipe
-
 
 class SimpleRecipeSerializer(ModelSerializer):
     """Сериализатор рецептов краткий."""
     image = Base64ImageField()
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class SubscribeSerializer(ModelSerializer):
@@ -313,37 +447,21 @@ class SubscribeSerializer(ModelSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request:
-            return False
-        user = request.user
-        if user.is_anonymous:
-            return False
-        return user.user_subscribe.filter(author_recipies=obj).exists()
+        return obj.id in viewer_subscriptions(self.context.get('request'))
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request:
             return []
-        recipes_limit = request.GET.get('recipes_limit')
-        queryset = obj.recipes.all()
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        if hasattr(obj, 'recipes_preview'):
+            queryset = obj.recipes_preview
+        else:
+            recipes_limit = request.GET.get('recipes_limit')
+            queryset = obj.recipes.all()
+            if recipes_limit:
+                queryset = queryset[:int(recipes_limit)]
         return SimpleRecipeSerializer(queryset, many=True,
                                       context={'request': request}).data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-    def validate(self, data):
-        author = self.context['author']
-        user = self.context['request'].user
-        if user.user_subscribe.filter(author_recipies=author).exists():
-            raise ValidationError(
-                detail='Вы уже подписаны.',
-                code=HTTP_400_BAD_REQUEST)
-        if user == author:
-            raise ValidationError(
-                detail='Не подписывайся на себя.',
-                code=HTTP_400_BAD_REQUEST)
-        return author
+        return obj.recipes_count
@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import catalogue_cache, recipe_cache
+from recipes.images import renditions_built
+from recipes.models import Amount, Ingredient, Recipe, Tag, User
+from recipes.signals import catalogue_changed
+
+# Поля пользователя, которые выводятся в рецептах его авторства.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver(catalogue_changed)
+def invalidate_catalogue_cache(sender, **kwargs):
+    """Сброс кэша справочника при изменении ингредиентов или тегов."""
+    catalogue_cache.invalidate(sender._meta.label)
+    recipe_cache.invalidate('catalogue')
+
+
+def invalidate_recipe(recipe_id, author_id):
+    recipe_cache.invalidate('list', f'author:{author_id}',
+                            f'recipe:{recipe_id}')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver(renditions_built, sender=Recipe)
+def invalidate_recipe_cache(sender, instance=None, recipe=None, **kwargs):
+    """Сброс кэша рецепта, списков и рецептов его автора."""
+    recipe = instance or recipe
+    invalidate_recipe(recipe.pk, recipe.author_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags_cache(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        invalidate_recipe(instance.pk, instance.author_id)
+
+
+@receiver([post_save, post_delete], sender=Amount)
+def invalidate_recipe_amounts_cache(sender, instance, **kwargs):
+    author_id = Recipe.objects.filter(pk=instance.recipe_id).values_list(
+        'author_id', flat=True).first()
+    invalidate_recipe(instance.recipe_id, author_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_author_cache(sender, instance, created=False,
+                            update_fields=None, **kwargs):
+    """Сброс кэша рецептов автора при изменении выводимых полей профиля."""
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    recipe_cache.invalidate('list', f'author:{instance.pk}', *(
+        f'recipe:{recipe_id}' for recipe_id
+        in instance.recipes.values_list('id', flat=True)))
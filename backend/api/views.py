@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
@@ -11,17 +12,49 @@ from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
                                    HTTP_404_NOT_FOUND)
 from rest_framework.viewsets import ModelViewSet
 
+from api.cache import (AnonymousRecipeCacheMixin, CachedListMixin,
+                       PersonalizedRecipeMixin)
 from api.filters import IngredientFilter, RecipeFilter
 from api.paginators import StandardResultsSetPagination
 from api.permissions import IsAuthorOrReadOnly
-from api.querysets import shopping_cart_file
-from api.serializers import (AvatarSerializer, CreateRecipeSerializer,
-                             FavoriteRecipeSerializer, IngredientSerializer,
-                             RecipeSerializer, ShoppingListSerializer,
-                             SubscribeSerializer, TagSerializer,
-                             UserCreateSerializer, UserSerializer)
+from api.querysets import (bulk_relations, delete_unique, insert_ignore,
+                           prefetch_recipes_preview, recipes_queryset,
+                           shopping_cart_file)
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from api.serializers import (AvatarSerializer, BatchSerializer,
+                             CreateRecipeSerializer, FavoriteRecipeSerializer,
+                             IngredientSerializer, RecipeSerializer,
+                             ShoppingListSerializer, SubscribeSerializer,
+                             TagSerializer, UserCreateSerializer,
+                             UserSerializer, requested_fields)
 from recipes.models import (Chosen, Ingredient, Recipe, ShoppingList,
                             Subscribe, Tag, User)
+from recipes.scores import count_view
+
+USER_COLUMNS = ('email', 'username', 'first_name', 'last_name', 'avatar')
+
+BATCH_STATUSES = {'POST': ('added', 'exists'), 'DELETE': ('deleted', 'absent')}
+
+
+def batch_relations(request, model, field, targets):
+    """Пакетное изменение связей пользователя с объектами из targets.
+
+    Все id проверяются одним запросом. Возвращает результат по каждому id и
+    список id, связь с которыми изменилась.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    found = set(targets.filter(id__in=ids).values_list('id', flat=True))
+    changed = set(bulk_relations(
+        model, request.user, field, [pk for pk in ids if pk in found],
+        add=request.method == 'POST'))
+    done, skipped = BATCH_STATUSES[request.method]
+    results = [{'id': pk,
+                'status': (done if pk in changed else skipped)
+                if pk in found else 'not_found'}
+               for pk in ids]
+    return results, list(changed)
 
 
 class UsersViewSet(ModelViewSet):
@@ -32,11 +65,23 @@ class UsersViewSet(ModelViewSet):
     permission_classes = (AllowAny,)
     serializer_class = UserSerializer
 
+    def get_queryset(self):
+        fields = requested_fields(self.request)
+        if self.request.method == 'GET' and fields is not None:
+            return User.objects.only('id', *(
+                field for field in fields if field in USER_COLUMNS))
+        return User.objects.all()
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return UserSerializer
         return UserCreateSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
     @action(methods=['get'],
             detail=False,
             permission_classes=[IsAuthenticated],
@@ -46,6 +91,9 @@ class UsersViewSet(ModelViewSet):
             user = self.request.user
             subscribes = user.subscribers.all()
             pages = self.paginate_queryset(subscribes)
+            recipes_limit = request.query_params.get('recipes_limit')
+            prefetch_recipes_preview(
+                pages, int(recipes_limit) if recipes_limit else None)
             serializer = SubscribeSerializer(pages, many=True,
                                              context={'request': request})
             return self.get_paginated_response(serializer.data)
@@ -56,21 +104,35 @@ class UsersViewSet(ModelViewSet):
             url_path='subscribe')
     def subscribe(self, request, pk=None, *args, **kwargs):
         user = self.request.user
-        author = get_object_or_404(User, id=pk)
         if self.request.method == 'POST':
-            serializer = SubscribeSerializer(data={'author': author},
-                                             context={'request': request,
-                                                      'author': author})
-            serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=user, author_recipies=author)
+            author = get_object_or_404(User, id=pk)
+            if user == author:
+                return Response({'detail': 'Не подписывайся на себя.'},
+                                status=HTTP_400_BAD_REQUEST)
+            if not insert_ignore(Subscribe(user=user,
+                                           author_recipies=author)):
+                return Response({'detail': 'Вы уже подписаны.'},
+                                status=HTTP_400_BAD_REQUEST)
+            serializer = SubscribeSerializer(author,
+                                             context={'request': request})
             return Response(serializer.data, status=HTTP_201_CREATED)
-        subscription = user.user_subscribe.filter(author_recipies=author)
-        if not subscription.exists():
+        if not delete_unique(Subscribe(user=user, author_recipies_id=pk)):
+            get_object_or_404(User, id=pk)
             return Response({'detail': 'Вы не подписаны.'},
                             status=HTTP_400_BAD_REQUEST)
-        subscription.delete()
         return Response(status=HTTP_204_NO_CONTENT)
 
+    @action(methods=['post', 'delete'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path='subscribe')
+    def subscribe_batch(self, request, *args, **kwargs):
+        with transaction.atomic():
+            results, _ = batch_relations(
+                request, Subscribe, 'author_recipies',
+                User.objects.exclude(id=request.user.id))
+        return Response(results, status=HTTP_200_OK)
+
     @action(methods=['get'], detail=False,
             permission_classes=[IsAuthenticated], url_path='me')
     def get_current_user_info(self, request):
@@ -87,7 +149,6 @@ class UsersViewSet(ModelViewSet):
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=HTTP_200_OK)
-        request.user.avatar.delete()
         request.user.avatar = None
         request.user.save()
         return Response(status=HTTP_204_NO_CONTENT)
@@ -103,8 +164,10 @@ class UsersViewSet(ModelViewSet):
         return Response(serializer.data, status=HTTP_204_NO_CONTENT)
 
 
-class TagsViewSet(ModelViewSet):
+class TagsViewSet(CachedListMixin, ModelViewSet):
     """Модель get запросов для получения списка тэгов."""
+    cache_label = Tag._meta.label
+    cache_params = ('name',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     http_method_names = ['get']
@@ -113,8 +176,10 @@ class TagsViewSet(ModelViewSet):
     pagination_class = None
 
 
-class IngredientsViewSet(ModelViewSet):
+class IngredientsViewSet(CachedListMixin, ModelViewSet):
     """Модель get запросов для получения списка ингредиентов."""
+    cache_label = Ingredient._meta.label
+    cache_params = ('name',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     http_method_names = ['get']
@@ -124,7 +189,8 @@ class IngredientsViewSet(ModelViewSet):
     pagination_class = None
 
 
-class RecipesViewSet(ModelViewSet):
+class RecipesViewSet(AnonymousRecipeCacheMixin, PersonalizedRecipeMixin,
+                     ModelViewSet):
     """По модели Recipe стандартные виды запросов через viewsets."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
@@ -133,11 +199,29 @@ class RecipesViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     permission_classes = (IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly)
 
+    def get_queryset(self):
+        fields = None
+        if self.request.method == 'GET':
+            fields = requested_fields(self.request)
+        return recipes_queryset(self.request.user, fields)
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', requested_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт из кэша, просмотр копится в буфере до записи в базу."""
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == HTTP_200_OK:
+            count_view(kwargs[self.lookup_field])
+        return response
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         recipe = get_object_or_404(Recipe, id=pk)
@@ -150,19 +234,18 @@ class RecipesViewSet(ModelViewSet):
             url_path='favorite')
     def favorite(self, request, pk=None, *args, **kwargs):
         user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        chosen = user.favorited.filter(recipe=recipe)
         if self.request.method == 'POST':
-            serializer = FavoriteRecipeSerializer(data={'recipe': recipe},
-                                                  context={'request': request,
-                                                           'recipe': recipe})
-            serializer.is_valid(raise_exception=True)
-            Chosen.objects.update_or_create(user=user, recipe=recipe)
+            recipe = get_object_or_404(Recipe, id=pk)
+            if not insert_ignore(Chosen(user=user, recipe=recipe)):
+                return Response({'detail': 'Рецепт уже в избранном.'},
+                                status=HTTP_400_BAD_REQUEST)
+            serializer = FavoriteRecipeSerializer(
+                recipe, context={'request': request})
             return Response(serializer.data, status=HTTP_201_CREATED)
-        if not chosen.exists():
+        if not delete_unique(Chosen(user=user, recipe_id=pk)):
+            get_object_or_404(Recipe, id=pk)
             return Response({'detail': 'Рецепт не в избранном.'},
                             status=HTTP_400_BAD_REQUEST)
-        chosen.delete()
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(methods=['post', 'delete'],
@@ -171,24 +254,47 @@ class RecipesViewSet(ModelViewSet):
             url_path='shopping_cart')
     def shopping_list(self, request, pk=None, *args, **kwargs):
         user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        list = user.in_shopping_cart.filter(recipe=recipe)
         if self.request.method == 'POST':
-            serializer = ShoppingListSerializer(data={'recipe': recipe},
-                                                context={'request': request,
-                                                         'recipe': recipe})
-            serializer.is_valid(raise_exception=True)
-            ShoppingList.objects.update_or_create(user=user, recipe=recipe)
+            recipe = get_object_or_404(Recipe, id=pk)
+            with transaction.atomic():
+                if not insert_ignore(ShoppingList(user=user, recipe=recipe)):
+                    return Response(
+                        {'detail': 'Рецепт уже в списке покупок.'},
+                        status=HTTP_400_BAD_REQUEST)
+            serializer = ShoppingListSerializer(
+                recipe, context={'request': request})
             return Response(serializer.data, status=HTTP_201_CREATED)
-        if not list.exists():
-            return Response({'detail': 'Рецепт не в списке покупок.'},
-                            status=HTTP_400_BAD_REQUEST)
-        list.delete()
+        with transaction.atomic():
+            if not delete_unique(ShoppingList(user=user, recipe_id=pk)):
+                get_object_or_404(Recipe, id=pk)
+                return Response({'detail': 'Рецепт не в списке покупок.'},
+                                status=HTTP_400_BAD_REQUEST)
         return Response(status=HTTP_204_NO_CONTENT)
 
+    @action(methods=['post', 'delete'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path='favorite')
+    def favorite_batch(self, request, *args, **kwargs):
+        with transaction.atomic():
+            results, _ = batch_relations(request, Chosen, 'recipe',
+                                         Recipe.objects.all())
+        return Response(results, status=HTTP_200_OK)
+
+    @action(methods=['post', 'delete'],
+            detail=False,
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart')
+    def shopping_list_batch(self, request, *args, **kwargs):
+        with transaction.atomic():
+            results, _ = batch_relations(request, ShoppingList, 'recipe',
+                                         Recipe.objects.all())
+        return Response(results, status=HTTP_200_OK)
+
     @action(methods=['get'],
             detail=False,
             permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, PDFRenderer],
             url_path='download_shopping_cart')
     def download_shopping_cart(self, request, *args, **kwargs):
         if self.request.method == 'GET':
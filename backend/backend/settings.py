@@ -11,6 +11,30 @@ MIN_COOKING_TIME = 1
 
 MAX_COOKING_TIME = 32000
 
+INGREDIENT_SEARCH_LIMIT = 50
+
+CATALOGUE_CACHE_TIMEOUT = 60
+
+TAG_SLUG_CACHE_TIMEOUT = 60
+
+# Вес события в оценках рецепта для лент popular и trending.
+RECIPE_SCORE_WEIGHTS = {
+    'favorite': 3.0,
+    'shopping_cart': 2.0,
+    'view': 0.1,
+}
+
+# Период полураспада оценки trending в секундах.
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', 24 * 60 * 60))
+
+# Как часто процесс записывает накопленные просмотры рецептов в базу, в
+# секундах.
+VIEWS_FLUSH_INTERVAL = int(os.getenv('VIEWS_FLUSH_INTERVAL', 10))
+
+PAGINATION_COUNT_TIMEOUT = 60
+
+BATCH_SIZE_LIMIT = 100
+
 SECRET_KEY = os.getenv('SECRET_KEY', 'SECRET_KEY')
 
 DEBUG = os.getenv('DEBUG', 'True').lower()
@@ -80,6 +104,22 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Кэш ответов API рецептов для анонимных пользователей. Для нескольких
+    # воркеров нужен общий бэкенд, например FileBasedCache на одном хосте
+    # или memcached/redis.
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPES_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RECIPES_CACHE_LOCATION', 'recipes'),
+        'TIMEOUT': int(os.getenv('RECIPES_CACHE_TIMEOUT', 300)),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -127,6 +167,23 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+
+IMAGE_RENDITION_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+SHOPPING_CART_FONT = os.getenv(
+    'SHOPPING_CART_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -139,6 +196,17 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
 
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from recipes.models import (Amount, Chosen, Recipe, ShoppingCartTotal,
+                            ShoppingList, Subscribe, User)
+
+# Счётчик: (модель со счётчиком, поле счётчика, считаемая модель, поле FK).
+COUNTERS = (
+    (Recipe, 'favorites_count', Chosen, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingList, 'recipe'),
+    (Recipe, 'ingredients_count', Amount, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscribe, 'author_recipies'),
+)
+
+
+def actual_count(counted_model, foreign_key):
+    """Подзапрос точного значения счётчика для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        counted_model.objects.filter(**{foreign_key: OuterRef('pk')})
+        .order_by().values(foreign_key).annotate(count=Count('pk'))
+        .values('count')), 0)
+
+
+def recount_cart_totals(user_ids, ingredient_ids=None):
+    """Пересчёт итогов списков покупок пользователей по их корзинам.
+
+    С ingredient_ids пересчитываются только итоги этих ингредиентов.
+    Строки пользователей блокируются, чтобы параллельные пересчёты одних
+    и тех же итогов шли по очереди.
+    """
+    with transaction.atomic():
+        user_ids = list(User.objects.select_for_update().filter(
+            id__in=user_ids).order_by('id').values_list('id', flat=True))
+        amounts = Amount.objects.filter(
+            recipe__in_shopping_cart__user__in=user_ids)
+        totals = ShoppingCartTotal.objects.filter(user__in=user_ids)
+        if ingredient_ids is not None:
+            amounts = amounts.filter(ingredient__in=ingredient_ids)
+            totals = totals.filter(ingredient__in=ingredient_ids)
+        rows = list(amounts.values_list(
+            'recipe__in_shopping_cart__user', 'ingredient').annotate(
+                total=Sum('amount')).order_by())
+        totals.delete()
+        ShoppingCartTotal.objects.bulk_create(
+            (ShoppingCartTotal(user_id=user_id, ingredient_id=ingredient_id,
+                               total=total)
+             for user_id, ingredient_id, total in rows),
+            batch_size=1000)
+
+
+def recount_recipe_cart_totals(recipe_ingredients):
+    """Пересчёт итогов у всех, чьи корзины содержат изменённые рецепты.
+
+    recipe_ingredients - пары (id рецепта, id ингредиента).
+    """
+    recipe_ids = {recipe_id for recipe_id, _ in recipe_ingredients}
+    user_ids = set(ShoppingList.objects.filter(
+        recipe__in=recipe_ids).values_list('user_id', flat=True))
+    if user_ids:
+        recount_cart_totals(user_ids, {
+            ingredient_id for _, ingredient_id in recipe_ingredients})
@@ -0,0 +1,76 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITION_FORMAT, RENDITION_EXT = (
+    ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg'))
+
+# Отправляется после сохранения копий, так как update() не шлёт post_save.
+renditions_built = Signal()
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='image-renditions')
+
+
+def build_renditions(recipe_id):
+    """Создание уменьшенных копий фото рецепта.
+
+    Размеры копий задаются в settings.IMAGE_RENDITIONS. Пути к копиям
+    сохраняются в image_renditions, только если фото рецепта не успело
+    смениться.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'author').first()
+    if recipe is None or not recipe.image:
+        return
+    storage = recipe.image.storage
+    source = recipe.image.name
+    renditions = {}
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for name, size in settings.IMAGE_RENDITIONS.items():
+            rendition = image.copy()
+            rendition.thumbnail(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            rendition.save(buffer, RENDITION_FORMAT,
+                           quality=settings.IMAGE_RENDITION_QUALITY)
+            renditions[name] = storage.save(
+                f'recipes/renditions/{name}.{RENDITION_EXT}',
+                ContentFile(buffer.getvalue()))
+    if Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_renditions=renditions):
+        renditions_built.send(sender=Recipe, recipe=recipe)
+
+
+def reset_renditions(recipe):
+    """Сброс уменьшенных копий фото рецепта.
+
+    Файлы копий могут быть общими у рецептов с одинаковым фото, поэтому
+    они не удаляются, а собираются командой collect_media_garbage.
+    """
+    recipe.image_renditions = {}
+
+
+def run_build_renditions(recipe_id):
+    try:
+        build_renditions(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_renditions(recipe_id):
+    """Постановка обработки фото в пул воркеров после коммита."""
+    transaction.on_commit(
+        lambda: executor.submit(run_build_renditions, recipe_id))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных копий фото для рецептов."""
+    help = ('Создаёт уменьшенные копии фото для рецептов, у которых их '
+            'нет. С ключом --all пересоздаёт копии для всех рецептов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+        count = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            build_renditions(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {count}'))
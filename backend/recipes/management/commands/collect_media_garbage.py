@@ -0,0 +1,85 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.models import Recipe, User
+
+MEDIA_DIRECTORIES = ('recipes', 'avatar')
+
+
+class Command(BaseCommand):
+    """Удаление файлов медиа, на которые не ссылается ни одна запись."""
+    help = ('Удаляет из каталогов recipes/ и avatar/ файлы, не указанные '
+            'ни в рецептах, ни в аватарах пользователей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе указанного числа секунд.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены.')
+
+    def referenced_files(self):
+        referenced = set(User.objects.exclude(avatar='').exclude(
+            avatar__isnull=True).values_list('avatar', flat=True))
+        for image, renditions in Recipe.objects.values_list(
+                'image', 'image_renditions').iterator():
+            referenced.add(image)
+            referenced.update(renditions.values())
+        return referenced
+
+    def is_referenced(self, name):
+        """Повторная проверка файла прямо перед удалением.
+
+        Пока команда обходила каталоги, файл могли загрузить заново и
+        сослаться на него из новой записи.
+        """
+        renditions = Q()
+        for rendition in settings.IMAGE_RENDITIONS:
+            renditions |= Q(**{f'image_renditions__{rendition}': name})
+        return (User.objects.filter(avatar=name).exists()
+                or Recipe.objects.filter(Q(image=name) | renditions).exists())
+
+    def is_recent(self, name, deadline):
+        try:
+            return os.path.getmtime(default_storage.path(name)) > deadline
+        except FileNotFoundError:
+            return True
+
+    def stored_files(self, directory):
+        directories, files = default_storage.listdir(directory)
+        for file in files:
+            yield f'{directory}/{file}'
+        for subdirectory in directories:
+            yield from self.stored_files(f'{directory}/{subdirectory}')
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_files()
+        deadline = time.time() - options['min_age']
+        removed = 0
+        freed = 0
+        for directory in MEDIA_DIRECTORIES:
+            if not default_storage.exists(directory):
+                continue
+            for name in self.stored_files(directory):
+                if name in referenced or self.is_recent(name, deadline):
+                    continue
+                if self.is_referenced(name) or self.is_recent(name, deadline):
+                    continue
+                removed += 1
+                freed += default_storage.size(name)
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    default_storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed / 1024:.0f} КБ.'))
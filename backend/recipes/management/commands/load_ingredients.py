@@ -0,0 +1,84 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient
+from recipes.signals import catalogue_changed
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.csv'
+
+
+class Command(BaseCommand):
+    """Загрузка ингредиентов из CSV или JSON пакетами bulk_create."""
+    help = ('Загружает ингредиенты из файла CSV (название, единица '
+            'измерения) или JSON. Уже существующие пары пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(DEFAULT_PATH),
+            help='Путь к файлу .csv или .json.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для bulk_create.')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать новые строки, без записи в базу.')
+
+    def read_rows(self, path):
+        """Построчное чтение пар (название, единица измерения)."""
+        if path.suffix == '.json':
+            with open(path, encoding='utf-8') as file:
+                for item in json.load(file):
+                    yield item['name'], item['measurement_unit']
+            return
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.reader(file):
+                if len(row) != 2:
+                    raise CommandError(f'Неверная строка: {row}')
+                yield row[0], row[1]
+
+    def new_ingredients(self, rows, existing):
+        for name, measurement_unit in rows:
+            key = (name.strip(), measurement_unit.strip())
+            if key in existing:
+                self.skipped += 1
+                continue
+            existing.add(key)
+            yield Ingredient(name=key[0], measurement_unit=key[1])
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        start = time.monotonic()
+        existing = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+        self.skipped = 0
+        created = 0
+        ingredients = self.new_ingredients(self.read_rows(path), existing)
+        while True:
+            batch = list(islice(ingredients, options['batch_size']))
+            if not batch:
+                break
+            if not options['dry_run']:
+                Ingredient.objects.bulk_create(batch)
+            created += len(batch)
+        if created and not options['dry_run']:
+            catalogue_changed.send(sender=Ingredient)
+        elapsed = time.monotonic() - start
+        rows = created + self.skipped
+        action = 'Будет добавлено' if options['dry_run'] else 'Добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action}: {created}, пропущено: {self.skipped}, '
+            f'{rows / elapsed if elapsed else rows:.0f} строк/с '
+            f'за {elapsed:.2f} с.'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import Amount, ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    """Пересчёт итогов списков покупок по рецептам в корзинах."""
+    help = ('Пересобирает таблицу итогов списков покупок. '
+            'С ключом --verify только сверяет её с рецептами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Сверить итоги без перезаписи таблицы.')
+
+    def expected_totals(self):
+        totals = Amount.objects.filter(
+            recipe__in_shopping_cart__isnull=False).values_list(
+                'recipe__in_shopping_cart__user', 'ingredient').annotate(
+                    total=Sum('amount')).order_by()
+        return {(user_id, ingredient_id): total
+                for user_id, ingredient_id, total in totals}
+
+    def handle(self, *args, **options):
+        expected = self.expected_totals()
+        if options['verify']:
+            stored = {
+                (user_id, ingredient_id): total
+                for user_id, ingredient_id, total
+                in ShoppingCartTotal.objects.values_list(
+                    'user_id', 'ingredient_id', 'total')}
+            mismatches = [
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)]
+            for user_id, ingredient_id in sorted(mismatches):
+                self.stdout.write(
+                    f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                    f'ожидалось {expected.get((user_id, ingredient_id))}, '
+                    f'в таблице {stored.get((user_id, ingredient_id))}')
+            if mismatches:
+                raise CommandError(f'Расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги совпадают, строк: {len(stored)}'))
+            return
+        with transaction.atomic():
+            ShoppingCartTotal.objects.all().delete()
+            ShoppingCartTotal.objects.bulk_create(
+                (ShoppingCartTotal(user_id=user_id,
+                                   ingredient_id=ingredient_id,
+                                   total=total)
+                 for (user_id, ingredient_id), total in expected.items()),
+                batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги пересобраны, строк: {len(expected)}'))
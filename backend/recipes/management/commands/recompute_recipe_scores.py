@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.scores import recompute_scores
+
+
+class Command(BaseCommand):
+    """Периодический пересчёт оценок рецептов для лент."""
+    help = ('Создаёт недостающие оценки рецептов, применяет затухание к '
+            'trending и пересчитывает popular. Запускается по расписанию, '
+            'например раз в час из cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета при создании недостающих оценок.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = recompute_scores(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки пересчитаны, создано новых: {created}'))
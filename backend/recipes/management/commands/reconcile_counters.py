@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    """Сверка и исправление денормализованных счётчиков."""
+    help = ('Пересчитывает счётчики избранного, списков покупок, рецептов '
+            'и подписчиков и исправляет разошедшиеся значения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать количество расхождений.')
+
+    def handle(self, *args, **options):
+        for model, field, counted_model, foreign_key in COUNTERS:
+            drifted = model.objects.annotate(
+                actual=actual_count(counted_model, foreign_key)).exclude(
+                    **{field: F('actual')})
+            with transaction.atomic():
+                count = drifted.count()
+                if count and not options['dry_run']:
+                    model.objects.filter(
+                        pk__in=drifted.values('pk')).update(
+                            **{field: actual_count(counted_model,
+                                                   foreign_key)})
+            self.stdout.write(
+                f'{model._meta.object_name}.{field}: расхождений {count}')
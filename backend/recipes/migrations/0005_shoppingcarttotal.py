@@ -0,0 +1,64 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:51
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_cart_totals(apps, schema_editor):
+    Amount = apps.get_model('recipes', 'Amount')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    totals = Amount.objects.filter(
+        recipe__in_shopping_cart__isnull=False).values(
+            'recipe__in_shopping_cart__user', 'ingredient').annotate(
+                total=models.Sum('amount')).order_by()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=row['recipe__in_shopping_cart__user'],
+                          ingredient_id=row['ingredient'],
+                          total=row['total'])
+        for row in totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_recipe_options'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='amount',
+            options={'ordering': ('amount',), 'verbose_name': 'рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AlterField(
+            model_name='amount',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(32000)], verbose_name='Кол-во ингредиента'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(32000)], verbose_name='Время приготовления в минутах'),
+        ),
+        migrations.CreateModel(
+            name='ShoppingCartTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(default=0, verbose_name='Общее кол-во ингредиента')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_totals', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'итог списка покупок',
+                'verbose_name_plural': 'Итоги списков покупок',
+                'ordering': ('user', 'ingredient'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcarttotal',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_cart_totals'),
+        ),
+        migrations.RunPython(fill_shopping_cart_totals,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:58
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Chosen', 'recipe'),
+    ('Recipe', 'shopping_cart_count', 'ShoppingList', 'recipe'),
+    ('User', 'recipes_count', 'Recipe', 'author'),
+    ('User', 'subscribers_count', 'Subscribe', 'author_recipies'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, counted_model, foreign_key in COUNTERS:
+        counted = apps.get_model('recipes', counted_model).objects.filter(
+            **{foreign_key: models.OuterRef('pk')}).order_by().values(
+                foreign_key).annotate(count=models.Count('pk')).values(
+                    'count')
+        apps.get_model('recipes', model).objects.update(**{
+            field: Coalesce(models.Subquery(counted), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
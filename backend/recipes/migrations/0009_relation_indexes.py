@@ -0,0 +1,80 @@
+# Generated by Django 3.2.3 on 2026-10-18 17:59
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = (
+    ('Chosen', 'favorites_count'),
+    ('ShoppingList', 'shopping_cart_count'),
+)
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаление дублей избранного и списков покупок.
+
+    Счётчики из 0008 и суммы из 0005 посчитаны вместе с дублями, поэтому
+    для затронутых рецептов и пользователей они пересчитываются заново.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for model_name, field in COUNTERS:
+        model = apps.get_model('recipes', model_name)
+        keep = model.objects.values('user', 'recipe').annotate(
+            keep_id=models.Min('id')).values('keep_id')
+        duplicates = model.objects.exclude(id__in=keep)
+        recipe_ids = set(duplicates.values_list('recipe', flat=True))
+        user_ids = set(duplicates.values_list('user', flat=True))
+        duplicates.delete()
+        counted = model.objects.filter(
+            recipe=models.OuterRef('pk')).order_by().values(
+                'recipe').annotate(count=models.Count('pk')).values('count')
+        Recipe.objects.filter(id__in=recipe_ids).update(**{
+            field: Coalesce(models.Subquery(counted), 0)})
+        if model_name == 'ShoppingList':
+            rebuild_shopping_cart_totals(apps, user_ids)
+
+
+def rebuild_shopping_cart_totals(apps, user_ids):
+    Amount = apps.get_model('recipes', 'Amount')
+    ShoppingCartTotal = apps.get_model('recipes', 'ShoppingCartTotal')
+    ShoppingCartTotal.objects.filter(user__in=user_ids).delete()
+    totals = Amount.objects.filter(
+        recipe__in_shopping_cart__user__in=user_ids).values(
+            'recipe__in_shopping_cart__user', 'ingredient').annotate(
+                total=models.Sum('amount')).order_by()
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(user_id=row['recipe__in_shopping_cart__user'],
+                          ingredient_id=row['ingredient'],
+                          total=row['total'])
+        for row in totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='amount',
+            index=models.Index(fields=['ingredient', 'recipe'], name='amount_ingredient_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscribe',
+            index=models.Index(fields=['author_recipies', 'user'], name='subscribe_author_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='chosen',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorites'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_list'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx'),
+    ]
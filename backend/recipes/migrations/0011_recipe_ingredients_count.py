@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    counted = apps.get_model('recipes', 'Amount').objects.filter(
+        recipe=models.OuterRef('pk')).order_by().values('recipe').annotate(
+            count=models.Count('pk')).values('count')
+    apps.get_model('recipes', 'Recipe').objects.update(
+        ingredients_count=Coalesce(models.Subquery(counted), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во ингредиентов'),
+        ),
+        migrations.RunPython(fill_ingredients_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_scores(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    weights = settings.RECIPE_SCORE_WEIGHTS
+    RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=recipe_id,
+                     popular=favorites * weights['favorite']
+                     + shopping_carts * weights['shopping_cart'])
+         for recipe_id, favorites, shopping_carts in
+         Recipe.objects.values_list(
+             'id', 'favorites_count', 'shopping_cart_count').iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_ingredients_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность за последнее время')),
+                ('decayed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время последнего затухания')),
+            ],
+            options={
+                'verbose_name': 'оценка рецепта',
+                'verbose_name_plural': 'Оценки рецептов',
+                'ordering': ('-popular', '-recipe'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='score_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipescore',
+            name='pending_views',
+            field=models.PositiveIntegerField(default=0, verbose_name='Просмотры до пересчёта оценок'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:10
+
+from django.db import migrations
+
+from recipes.search import create_search_table, drop_search_table
+
+
+def create_search_index(apps, schema_editor):
+    create_search_table(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    drop_search_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_score_pending_views'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -2,13 +2,35 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from backend.settings import (MAX_AMOUNT, MAX_COOKING_TIME, MIN_AMOUNT,
                               MIN_COOKING_TIME)
 
 
-class User(AbstractUser):
+class CountersSaveMixin:
+    """Сохранение записи без денормализованных счётчиков.
+
+    Счётчики из counter_fields меняются только UPDATE из сигналов, поэтому
+    обычный save() существующей записи не пишет их обратно: иначе
+    значения, загруженные вместе с объектом, затёрли бы изменения
+    параллельных запросов.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+class User(CountersSaveMixin, AbstractUser):
     """Модель пользователей"""
 
     class Role(models.TextChoices):
@@ -35,6 +57,17 @@ class User(AbstractUser):
         verbose_name='Фото аватара',
     )
     password = models.CharField(max_length=254)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков'
+    )
+    counter_fields = ('recipes_count', 'subscribers_count')
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
     USERNAME_FIELD = 'email'
     subscriptions = models.ManyToManyField(
@@ -80,6 +113,7 @@ class Ingredient(models.Model):
     """Модель ингредиента."""
     name = models.CharField(
         max_length=128,
+        db_index=True,
         verbose_name='Название'
     )
     measurement_unit = models.CharField(
@@ -97,7 +131,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersSaveMixin, models.Model):
     """Модель рецептов"""
 
     author = models.ForeignKey(
@@ -110,6 +144,11 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Фото блюда',
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии фото',
+    )
     text = models.TextField(
         verbose_name='Описание блюда',
     )
@@ -127,6 +166,23 @@ class Recipe(models.Model):
                     MaxValueValidator(MAX_COOKING_TIME)),
         verbose_name='Время приготовления в минутах'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    ingredients_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во ингредиентов'
+    )
+    counter_fields = (
+        'favorites_count', 'shopping_cart_count', 'ingredients_count')
 
     class Meta:
         verbose_name = 'рецепт'
@@ -157,6 +213,9 @@ class Amount(models.Model):
             models.UniqueConstraint(
                 fields=['recipe', 'ingredient'],
                 name='unique_ingredients')]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='amount_ingredient_recipe_idx')]
 
     def __str__(self):
         return f'{self.recipe} {self.ingredient} {self.amount}'
@@ -181,6 +240,10 @@ class Chosen(models.Model):
         verbose_name = 'избранный'
         verbose_name_plural = 'Избранные'
         ordering = ('id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorites')]
 
     def __str__(self):
         return f'{self.recipe}'
@@ -210,6 +273,9 @@ class Subscribe(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'author_recipies'],
                 name='unique_subscribes')]
+        indexes = [
+            models.Index(fields=['author_recipies', 'user'],
+                         name='subscribe_author_user_idx')]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author_recipies}'
@@ -234,6 +300,86 @@ class ShoppingList(models.Model):
         verbose_name = 'список покупок'
         verbose_name_plural = 'Списки покупок'
         ordering = ('recipe',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_list')]
 
     def __str__(self):
         return f'{self.recipe}'
+
+
+class ShoppingCartTotal(models.Model):
+    """Итоговое кол-во ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals'
+    )
+    total = models.IntegerField(
+        default=0,
+        verbose_name='Общее кол-во ингредиента'
+    )
+
+    class Meta:
+        verbose_name = 'итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        ordering = ('user', 'ingredient')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_totals')]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient} {self.total}'
+
+
+class RecipeScore(models.Model):
+    """Предрасчитанные оценки рецепта для лент popular и trending."""
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='score'
+    )
+    views = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Просмотры'
+    )
+    pending_views = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Просмотры до пересчёта оценок'
+    )
+    popular = models.FloatField(
+        default=0,
+        verbose_name='Популярность'
+    )
+    trending = models.FloatField(
+        default=0,
+        verbose_name='Популярность за последнее время'
+    )
+    decayed_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Время последнего затухания'
+    )
+
+    class Meta:
+        verbose_name = 'оценка рецепта'
+        verbose_name_plural = 'Оценки рецептов'
+        ordering = ('-popular', '-recipe')
+        indexes = [
+            models.Index(fields=['-popular', '-recipe'],
+                         name='score_popular_idx'),
+            models.Index(fields=['-trending', '-recipe'],
+                         name='score_trending_idx')]
+
+    def __str__(self):
+        return f'{self.recipe} {self.popular} {self.trending}'
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, F, Min, Value, When
+from django.utils import timezone
+
+from recipes.counters import actual_count
+from recipes.models import Chosen, Recipe, RecipeScore, ShoppingList
+
+# Событие оценки рецепта для записи связи пользователя с рецептом.
+SCORE_EVENTS = {
+    Chosen: 'favorite',
+    ShoppingList: 'shopping_cart',
+}
+
+
+def bump_scores(recipe_ids, event):
+    """Инкрементальное увеличение оценок рецептов одним UPDATE.
+
+    trending копит события между запусками команды
+    recompute_recipe_scores и при удалении связей не уменьшается: событие
+    уже произошло. popular при удалении пересчитывается recompute_popular.
+    """
+    weight = settings.RECIPE_SCORE_WEIGHTS[event]
+    RecipeScore.objects.filter(recipe__in=recipe_ids).update(
+        popular=F('popular') + weight, trending=F('trending') + weight)
+
+
+def add_pending_views(views):
+    """Перенос просмотров {id рецепта: число} в pending_views одним UPDATE."""
+    if not views:
+        return
+    added = Case(*(When(recipe=pk, then=Value(count))
+                   for pk, count in views.items()), default=Value(0))
+    RecipeScore.objects.filter(recipe__in=views).update(
+        pending_views=F('pending_views') + added)
+
+
+class ViewBuffer:
+    """Просмотры рецептов, накопленные процессом между записями в базу.
+
+    Раз в VIEWS_FLUSH_INTERVAL секунд буфер переносится в
+    RecipeScore.pending_views одним UPDATE с приращением F(), так что
+    просмотры всех воркеров копятся в общей базе, а горячий рецепт не
+    блокирует строку своей оценки на каждом просмотре. При остановке
+    процесса теряются просмотры не более чем за интервал.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, recipe_id):
+        with self.lock:
+            self.views[int(recipe_id)] += 1
+            now = time.monotonic()
+            if now - self.flushed_at < settings.VIEWS_FLUSH_INTERVAL:
+                return
+            views, self.views, self.flushed_at = self.views, Counter(), now
+        add_pending_views(views)
+
+
+view_buffer = ViewBuffer()
+
+
+def count_view(recipe_id):
+    """Учёт просмотра рецепта через буфер процесса."""
+    view_buffer.add(recipe_id)
+
+
+def popular_score():
+    """Выражение popular по фактическому числу связей и просмотрам."""
+    weights = settings.RECIPE_SCORE_WEIGHTS
+    return (actual_count(Chosen, 'recipe') * weights['favorite']
+            + actual_count(ShoppingList, 'recipe') * weights['shopping_cart']
+            + (F('views') + F('pending_views')) * weights['view'])
+
+
+def recompute_popular(recipe_ids):
+    """Точный пересчёт popular для рецептов одним UPDATE."""
+    RecipeScore.objects.filter(recipe__in=recipe_ids).update(
+        popular=popular_score())
+
+
+def recompute_scores(batch_size=1000):
+    """Пакетный пересчёт оценок всех рецептов.
+
+    Создаются недостающие строки оценок, затем один UPDATE переносит
+    pending_views в просмотры и trending, применяет к trending
+    экспоненциальное затухание с периодом полураспада
+    TRENDING_HALF_LIFE за время с прошлого запуска и считает заново
+    popular по числу добавлений в избранное, в списки покупок и
+    просмотрам. Все строки получают одну метку decayed_at, поэтому время
+    прошлого запуска - наименьшая метка. Возвращает число созданных строк.
+    """
+    missing = Recipe.objects.filter(score__isnull=True).values_list(
+        'id', flat=True)
+    created = len(RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=recipe_id) for recipe_id in missing.iterator()),
+        batch_size=batch_size, ignore_conflicts=True))
+    now = timezone.now()
+    decayed_at = RecipeScore.objects.aggregate(
+        decayed_at=Min('decayed_at'))['decayed_at'] or now
+    elapsed = max((now - decayed_at).total_seconds(), 0)
+    factor = 0.5 ** (elapsed / settings.TRENDING_HALF_LIFE)
+    weight = settings.RECIPE_SCORE_WEIGHTS['view']
+    RecipeScore.objects.update(
+        views=F('views') + F('pending_views'),
+        pending_views=0,
+        trending=(F('trending') + F('pending_views') * weight) * factor,
+        popular=popular_score(),
+        decayed_at=now)
+    return created
@@ -0,0 +1,72 @@
+"""Полнотекстовый индекс рецептов FTS5 для SQLite.
+
+На PostgreSQL поиск идёт по столбцу search_vector, на SQLite - по
+виртуальной таблице SEARCH_TABLE, которую синхронизируют с рецептами
+триггеры. Таблица без собственного содержимого (content=''), в неё
+пишутся название и описание с ё, заменённой на е: токенизатор unicode61
+снимает диакритику только с латиницы.
+"""
+SEARCH_TABLE = 'recipes_recipe_fts'
+
+
+def folded(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def indexed_values(row):
+    return f"{folded(f'{row}.name')}, {folded(f'{row}.text')}"
+
+
+INSERT = (f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+          f"VALUES (new.id, {indexed_values('new')});")
+DELETE = (f'INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, text) '
+          f"VALUES ('delete', old.id, {indexed_values('old')});")
+TRIGGERS = {
+    'insert': f'AFTER INSERT ON recipes_recipe BEGIN {INSERT} END',
+    'delete': f'AFTER DELETE ON recipes_recipe BEGIN {DELETE} END',
+    'update': (f'AFTER UPDATE OF name, text ON recipes_recipe '
+               f'BEGIN {DELETE} {INSERT} END'),
+}
+
+
+def create_search_triggers(connection):
+    """Создание недостающих триггеров синхронизации индекса.
+
+    Миграции, пересоздающие таблицу рецептов на SQLite, удаляют её
+    триггеры, поэтому после каждого migrate они создаются заново, если
+    сам индекс уже есть.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [SEARCH_TABLE])
+        if cursor.fetchone() is None:
+            return
+        for name, trigger in TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS '
+                           f'{SEARCH_TABLE}_{name} {trigger}')
+
+
+def create_search_table(connection):
+    """Создание и заполнение индекса по уже сохранённым рецептам."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(name, text, '
+            "content='', tokenize='unicode61 remove_diacritics 2')")
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) SELECT id, '
+            f"{indexed_values('recipes_recipe')} FROM recipes_recipe")
+    create_search_triggers(connection)
+
+
+def drop_search_table(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
@@ -0,0 +1,202 @@
+import threading
+from collections import defaultdict
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_save)
+from django.dispatch import Signal
+
+from recipes.counters import (COUNTERS, actual_count, recount_cart_totals,
+                              recount_recipe_cart_totals)
+from recipes.models import Amount, Recipe, RecipeScore, ShoppingList
+from recipes.scores import SCORE_EVENTS, bump_scores, recompute_popular
+from recipes.search import create_search_triggers
+
+# Отправляется после пакетной записи справочника (sender - его модель),
+# так как bulk_create не шлёт post_save.
+catalogue_changed = Signal()
+
+# Отложенные до коммита пересчёты: {функция пересчёта: множество pk}.
+pending = threading.local()
+
+
+def pending_recounts():
+    if not hasattr(pending, 'recounts'):
+        pending.recounts = defaultdict(set)
+    return pending.recounts
+
+
+def defer_recount(recount, pk):
+    """Пересчёт по pk после коммита транзакции.
+
+    При каскадном удалении post_delete отправляется для каждой строки,
+    поэтому pk копятся и пересчитываются одним UPDATE на всю транзакцию.
+    Пересчёт идемпотентен, так что pk, оставшиеся от откаченной
+    транзакции, просто пересчитаются со следующими.
+    """
+    pending_recounts()[recount].add(pk)
+    transaction.on_commit(run_recounts)
+
+
+def run_recounts():
+    recounts = pending_recounts()
+    while recounts:
+        recount = next(iter(recounts))
+        recount(recounts.pop(recount))
+
+
+def change_counter(model, field, pk, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+# FK, при переносе записи по которым пересчитываются прежний и новый
+# объект: {модель: множество имён полей}.
+tracked_foreign_keys = defaultdict(set)
+
+
+def track_foreign_key(model, foreign_key):
+    tracked_foreign_keys[model].add(foreign_key)
+    pre_save.connect(remember_foreign_keys, sender=model,
+                     dispatch_uid=f'{model._meta.label_lower}_foreign_keys')
+
+
+def remember_foreign_keys(sender, instance, update_fields=None, **kwargs):
+    """Значения отслеживаемых FK существующей записи до save().
+
+    Админка и импорт могут перенести связь на другой объект, и без
+    прежнего значения счётчики не изменились бы ни у одной из сторон.
+    """
+    foreign_keys = tracked_foreign_keys[sender]
+    if update_fields is not None:
+        foreign_keys = foreign_keys & set(update_fields)
+    instance._previous_foreign_keys = {}
+    if foreign_keys and not instance._state.adding:
+        instance._previous_foreign_keys = sender.objects.filter(
+            pk=instance.pk).values(*foreign_keys).first() or {}
+
+
+def moved_from(instance, foreign_key):
+    """Прежнее значение FK, если save() перенёс запись, иначе None."""
+    previous = getattr(instance, '_previous_foreign_keys', {}).get(
+        foreign_key)
+    attname = type(instance)._meta.get_field(foreign_key).attname
+    if previous != getattr(instance, attname):
+        return previous
+    return None
+
+
+def connect_counter(model, field, counted_model, foreign_key):
+    """Изменение счётчика при создании, переносе и удалении записей."""
+    attname = counted_model._meta.get_field(foreign_key).attname
+
+    def increment(sender, instance, created, **kwargs):
+        if created:
+            change_counter(model, field, getattr(instance, attname), 1)
+            return
+        previous = moved_from(instance, foreign_key)
+        if previous is not None:
+            defer_recount(recount, previous)
+            defer_recount(recount, getattr(instance, attname))
+
+    def recount(pks):
+        model.objects.filter(pk__in=pks).update(
+            **{field: actual_count(counted_model, foreign_key)})
+
+    def decrement(sender, instance, **kwargs):
+        defer_recount(recount, getattr(instance, attname))
+
+    track_foreign_key(counted_model, foreign_key)
+    post_save.connect(increment, sender=counted_model, weak=False,
+                      dispatch_uid=f'{field}_increment')
+    post_delete.connect(decrement, sender=counted_model, weak=False,
+                        dispatch_uid=f'{field}_decrement')
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
+
+
+def create_score(sender, instance, created, **kwargs):
+    """Строка оценок для нового рецепта."""
+    if created:
+        RecipeScore.objects.get_or_create(recipe=instance)
+
+
+def connect_score(counted_model, event):
+    """Изменение оценок рецепта при добавлении и удалении связей с ним."""
+
+    def bump(sender, instance, created, **kwargs):
+        if created:
+            bump_scores([instance.recipe_id], event)
+            return
+        previous = moved_from(instance, 'recipe')
+        if previous is not None:
+            defer_recount(recompute_popular, previous)
+            defer_recount(recompute_popular, instance.recipe_id)
+
+    def unbump(sender, instance, **kwargs):
+        defer_recount(recompute_popular, instance.recipe_id)
+
+    track_foreign_key(counted_model, 'recipe')
+    post_save.connect(bump, sender=counted_model, weak=False,
+                      dispatch_uid=f'{event}_score_bump')
+    post_delete.connect(unbump, sender=counted_model, weak=False,
+                        dispatch_uid=f'{event}_score_unbump')
+
+
+post_save.connect(create_score, sender=Recipe,
+                  dispatch_uid='recipe_score_create')
+for score_event in SCORE_EVENTS.items():
+    connect_score(*score_event)
+
+
+def recount_user_cart(sender, instance, **kwargs):
+    """Итоги списка покупок пользователя после изменения его корзины.
+
+    Пересчитываются после коммита, в том числе при каскадном удалении
+    рецепта или пользователя, когда строк корзины и ингредиентов рецепта
+    уже нет.
+    """
+    defer_recount(recount_cart_totals, instance.user_id)
+    previous = moved_from(instance, 'user')
+    if previous is not None:
+        defer_recount(recount_cart_totals, previous)
+
+
+def recount_recipe_carts(sender, instance, **kwargs):
+    """Итоги списков покупок с рецептом после изменения его ингредиентов.
+
+    Для перенесённой строки пересчитываются и прежние рецепт и
+    ингредиент.
+    """
+    defer_recount(recount_recipe_cart_totals,
+                  (instance.recipe_id, instance.ingredient_id))
+    previous_recipe = moved_from(instance, 'recipe')
+    previous_ingredient = moved_from(instance, 'ingredient')
+    if previous_recipe is not None or previous_ingredient is not None:
+        defer_recount(recount_recipe_cart_totals, (
+            previous_recipe or instance.recipe_id,
+            previous_ingredient or instance.ingredient_id))
+
+
+track_foreign_key(ShoppingList, 'user')
+track_foreign_key(Amount, 'ingredient')
+post_save.connect(recount_user_cart, sender=ShoppingList,
+                  dispatch_uid='shopping_cart_totals_save')
+post_delete.connect(recount_user_cart, sender=ShoppingList,
+                    dispatch_uid='shopping_cart_totals_delete')
+post_save.connect(recount_recipe_carts, sender=Amount,
+                  dispatch_uid='recipe_cart_totals_save')
+post_delete.connect(recount_recipe_carts, sender=Amount,
+                    dispatch_uid='recipe_cart_totals_delete')
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    """Триггеры индекса FTS5, удалённые пересозданием таблицы рецептов."""
+    if sender.name == 'recipes':
+        create_search_triggers(connections[using])
+
+
+post_migrate.connect(restore_search_triggers,
+                     dispatch_uid='recipe_search_triggers')
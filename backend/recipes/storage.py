@@ -0,0 +1,33 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по хешу SHA-256 содержимого.
+
+    Файл сохраняется как <каталог>/<2 символа хеша>/<хеш>.<расширение>,
+    каталог берётся из upload_to. Одинаковые загрузки указывают на один
+    файл, поэтому файлы не удаляются вместе с записями, а собираются
+    командой collect_media_garbage. При повторной загрузке у файла
+    обновляется время изменения, чтобы сборщик не удалил его как старый.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(directory, digest[:2], digest + extension)
+        try:
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
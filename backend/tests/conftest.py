@@ -0,0 +1,64 @@
+import pytest
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Amount, Chosen, Ingredient, Recipe, ShoppingList,
+                            Subscribe, Tag, User)
+
+PAGE_SIZE = 6
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@foodgram.ru', username=username,
+        first_name='Имя', last_name='Фамилия', password='Pass12345')
+
+
+@pytest.fixture
+def user(db):
+    return create_user('reader')
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@pytest.fixture
+def anonymous_client():
+    return APIClient()
+
+
+@pytest.fixture
+def authors(user):
+    """Авторы с рецептами, которые пользователь добавил везде, куда можно."""
+    tags = [Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)]
+    ingredients = [
+        Ingredient.objects.create(name=f'Ингредиент {i}',
+                                  measurement_unit='г')
+        for i in range(3)]
+    authors = [create_user(f'author{i}') for i in range(PAGE_SIZE)]
+    for author in authors:
+        Subscribe.objects.create(user=user, author_recipies=author)
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/image.png', cooking_time=10)
+            recipe.tags.set(tags)
+            Amount.objects.bulk_create(
+                [Amount(recipe=recipe, ingredient=ingredient, amount=5)
+                 for ingredient in ingredients])
+            Chosen.objects.create(user=user, recipe=recipe)
+            ShoppingList.objects.create(user=user, recipe=recipe)
+    return authors
@@ -0,0 +1,69 @@
+"""Денормализованные счётчики и их отложенный пересчёт."""
+import pytest
+from django.db import transaction
+from tests.conftest import create_user
+
+from recipes.models import Chosen, Recipe, RecipeScore, Subscribe, User
+
+
+def refreshed(*instances):
+    for instance in instances:
+        instance.refresh_from_db()
+    return instances
+
+
+def test_counters_follow_api(user_client, authors,
+                             django_capture_on_commit_callbacks):
+    recipe = Recipe.objects.first()
+    assert recipe.favorites_count == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = user_client.delete(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 204
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 0
+
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == 201
+    recipe.refresh_from_db()
+    assert recipe.favorites_count == 1
+
+
+def test_decrements_wait_for_commit(user, authors,
+                                    django_capture_on_commit_callbacks):
+    recipes = list(Recipe.objects.all()[:3])
+    with django_capture_on_commit_callbacks(execute=True):
+        Chosen.objects.filter(user=user, recipe__in=recipes).delete()
+        assert all(recipe.favorites_count == 1
+                   for recipe in refreshed(*recipes))
+    assert all(recipe.favorites_count == 0 for recipe in refreshed(*recipes))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_moved_relations_recount_both_sides(user, authors):
+    first, second = Recipe.objects.all()[:2]
+    other = create_user('other')
+    favorite = Chosen.objects.create(user=other, recipe=first)
+    first.refresh_from_db()
+    assert first.favorites_count == 2
+
+    with transaction.atomic():
+        favorite.recipe = second
+        favorite.save()
+    first, second = refreshed(first, second)
+    assert (first.favorites_count, second.favorites_count) == (1, 2)
+    assert (RecipeScore.objects.get(recipe=first).popular
+            < RecipeScore.objects.get(recipe=second).popular)
+
+    subscription = Subscribe.objects.get(user=user,
+                                         author_recipies=first.author)
+    subscription.author_recipies = other
+    subscription.save()
+    assert User.objects.get(pk=first.author_id).subscribers_count == 0
+    assert User.objects.get(pk=other.pk).subscribers_count == 1
+
+    first.author = other
+    first.save()
+    assert User.objects.get(pk=other.pk).recipes_count == 1
+    assert User.objects.get(pk=second.author_id).recipes_count == (
+        Recipe.objects.filter(author=second.author_id).count())
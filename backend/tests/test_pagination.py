@@ -0,0 +1,29 @@
+"""Пагинация выдачи рецептов."""
+import pytest
+
+
+@pytest.mark.parametrize('client_name', ['anonymous_client', 'user_client'])
+def test_cursor_pagination_without_search_words(request, authors,
+                                                client_name):
+    client = request.getfixturevalue(client_name)
+    response = client.get(
+        '/api/recipes/', {'search': '!!!', 'pagination': 'cursor'})
+    assert response.status_code == 200
+    assert response.json()['count'] == 0
+    assert response.json()['results'] == []
+
+
+@pytest.mark.parametrize('ordering', ['popular', 'trending'])
+def test_score_feed_without_search_hits(anonymous_client, authors, ordering):
+    response = anonymous_client.get(
+        '/api/recipes/', {'search': 'zzzz', 'ordering': ordering})
+    assert response.status_code == 200
+    assert response.json()['count'] == 0
+    assert response.json()['results'] == []
+
+
+def test_cursor_pagination_rejects_search_ranking(anonymous_client, authors):
+    response = anonymous_client.get(
+        '/api/recipes/', {'search': 'zzzz', 'pagination': 'cursor'})
+    assert response.status_code == 400
+    assert 'pagination' in response.json()
@@ -0,0 +1,28 @@
+"""Число запросов к базе не должно зависеть от размера страницы."""
+from tests.conftest import PAGE_SIZE
+
+
+def test_recipe_list_anonymous(anonymous_client, authors,
+                               django_assert_num_queries):
+    with django_assert_num_queries(4):
+        response = anonymous_client.get('/api/recipes/')
+    assert len(response.json()['results']) == PAGE_SIZE
+
+
+def test_recipe_list_authenticated(user_client, authors,
+                                   django_assert_num_queries):
+    with django_assert_num_queries(9):
+        response = user_client.get('/api/recipes/')
+    results = response.json()['results']
+    assert len(results) == PAGE_SIZE
+    assert all(recipe['is_favorited'] and recipe['is_in_shopping_cart']
+               and recipe['author']['is_subscribed'] for recipe in results)
+
+
+def test_subscriptions_list(user_client, authors,
+                            django_assert_num_queries):
+    with django_assert_num_queries(5):
+        response = user_client.get('/api/users/subscriptions/')
+    results = response.json()['results']
+    assert len(results) == PAGE_SIZE
+    assert all(len(author['recipes']) == 2 for author in results)
@@ -0,0 +1,23 @@
+"""Оценки рецептов для лент popular и trending."""
+from django.core.management import call_command
+
+from recipes.models import Recipe, RecipeScore
+from recipes.scores import view_buffer
+
+
+def test_views_reach_scores(anonymous_client, authors, settings):
+    settings.VIEWS_FLUSH_INTERVAL = 0
+    recipe = Recipe.objects.first()
+    for _ in range(3):
+        response = anonymous_client.get(f'/api/recipes/{recipe.id}/')
+        assert response.status_code == 200
+    assert not view_buffer.views
+    assert RecipeScore.objects.get(recipe=recipe).pending_views == 3
+
+    call_command('recompute_recipe_scores')
+
+    score = RecipeScore.objects.get(recipe=recipe)
+    assert (score.views, score.pending_views) == (3, 0)
+    weights = settings.RECIPE_SCORE_WEIGHTS
+    assert score.popular == (
+        weights['favorite'] + weights['shopping_cart'] + 3 * weights['view'])
@@ -0,0 +1,32 @@
+"""Полнотекстовый поиск рецептов."""
+from recipes.models import Recipe
+
+
+def search(client, query):
+    response = client.get('/api/recipes/', {'search': query})
+    assert response.status_code == 200
+    return [recipe['name'] for recipe in response.json()['results']]
+
+
+def test_search_follows_recipe_changes(anonymous_client, authors):
+    recipe = Recipe.objects.first()
+    recipe.name = 'Ёжики с котлетами'
+    recipe.save()
+    assert search(anonymous_client, 'котлета ежик') == ['Ёжики с котлетами']
+
+    recipe.name = 'Блины'
+    recipe.save()
+    assert search(anonymous_client, 'котлета') == []
+    assert search(anonymous_client, 'блинами') == ['Блины']
+
+    recipe.delete()
+    assert search(anonymous_client, 'блинами') == []
+
+
+def test_search_ranks_name_above_text(anonymous_client, authors):
+    first, second = Recipe.objects.all()[:2]
+    first.text = 'Котлеты'
+    first.save()
+    second.name = 'Котлеты'
+    second.save()
+    assert search(anonymous_client, 'котлеты') == ['Котлеты', first.name]
@@ -0,0 +1,95 @@
+"""Выгрузка и итоги списка покупок."""
+import os
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from recipes.models import (Amount, Ingredient, Recipe, ShoppingCartTotal,
+                            ShoppingList)
+
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.mark.skipif(not os.path.isfile(settings.SHOPPING_CART_FONT),
+                    reason='нет шрифта SHOPPING_CART_FONT')
+def test_download_pdf(user_client, authors):
+    response = user_client.get(DOWNLOAD_URL, {'format': 'pdf'})
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content).startswith(b'%PDF')
+
+
+def test_download_pdf_without_font(user_client, authors, settings):
+    settings.SHOPPING_CART_FONT = '/nonexistent/font.ttf'
+    response = user_client.get(DOWNLOAD_URL, {'format': 'pdf'})
+    assert response.status_code == 503
+    assert 'шрифт' in response.content.decode()
+
+    response = user_client.get(DOWNLOAD_URL, {'format': 'txt'})
+    assert response.status_code == 200
+
+
+def verify_totals():
+    call_command('rebuild_shopping_cart_totals', verify=True)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_totals_follow_api_and_admin_changes(user, user_client, authors):
+    assert ShoppingCartTotal.objects.filter(user=user).exists()
+    verify_totals()
+    first, second = Recipe.objects.all()[:2]
+
+    response = user_client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+    assert response.status_code == 204
+    verify_totals()
+    response = user_client.post(f'/api/recipes/{first.id}/shopping_cart/')
+    assert response.status_code == 201
+    verify_totals()
+    ids = {'ids': [first.id, second.id]}
+    response = user_client.delete('/api/recipes/shopping_cart/', ids,
+                                  format='json')
+    assert response.status_code == 200
+    verify_totals()
+    response = user_client.post('/api/recipes/shopping_cart/', ids,
+                                format='json')
+    assert response.status_code == 200
+    verify_totals()
+
+    # Правки из админки: строки корзины и кол-ва ингредиентов рецепта.
+    ShoppingList.objects.get(user=user, recipe=first).delete()
+    verify_totals()
+    ShoppingList.objects.create(user=user, recipe=first)
+    verify_totals()
+    cart_row = ShoppingList.objects.get(user=user, recipe=second)
+    cart_row.user = second.author
+    cart_row.save()
+    verify_totals()
+    amount = Amount.objects.filter(recipe=first).first()
+    amount.amount = 7
+    amount.save()
+    verify_totals()
+    amount.ingredient = Ingredient.objects.create(
+        name='Соль', measurement_unit='г')
+    amount.save()
+    verify_totals()
+    Amount.objects.create(recipe=first, ingredient=Ingredient.objects.create(
+        name='Перец', measurement_unit='г'), amount=2)
+    verify_totals()
+    amount.delete()
+    verify_totals()
+
+    author_client = APIClient()
+    author_client.force_authenticate(second.author)
+    ingredient = Amount.objects.filter(recipe=second).first().ingredient_id
+    response = author_client.patch(f'/api/recipes/{second.id}/', {
+        'name': second.name, 'text': second.text, 'cooking_time': 5,
+        'tags': list(second.tags.values_list('id', flat=True)),
+        'ingredients': [{'id': ingredient, 'amount': 9}]}, format='json')
+    assert response.status_code == 200
+    verify_totals()
+
+    first.delete()
+    verify_totals()
+    second.author.delete()
+    verify_totals()